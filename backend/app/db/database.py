@@ -1,7 +1,10 @@
 import os
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 import logging
 from fastapi import HTTPException
@@ -25,6 +28,13 @@ from .base import Base
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional override for the async engine; by default DATABASE_URL with the aiomysql driver
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Async engine pool: 5 kept open, up to 10 more under load, recycled before MySQL's idle timeout
+ASYNC_POOL_SIZE = 5
+ASYNC_MAX_OVERFLOW = 10
+ASYNC_POOL_RECYCLE = 1800
 
 
 logging.basicConfig(level=logging.INFO)
@@ -217,8 +227,6 @@ def create_mysql_database_if_not_exists():
 def create_database_engine():
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL is not set in .env")
-    
-    create_mysql_database_if_not_exists()
 
     engine = create_engine(
         DATABASE_URL,
@@ -227,20 +235,43 @@ def create_database_engine():
         echo=False
     )
 
-    # Import all models before creating tables
-    try:
-        from app import model  # make sure models.User, etc., are defined here
-        Base.metadata.create_all(bind=engine)
-        print("✅ All tables created (if not already present)")
-    except Exception as e:
-        print(f"❌ Error creating tables: {e}")
-
     return engine
 
+def create_async_database_engine():
+    """Async engine for async routes: DATABASE_URL on aiomysql unless ASYNC_DATABASE_URL is set"""
+    url = ASYNC_DATABASE_URL
+    if not url:
+        url = make_url(DATABASE_URL)
+        if url.get_backend_name() == "mysql":
+            url = url.set(drivername="mysql+aiomysql")
+
+    return create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=ASYNC_POOL_SIZE,
+        max_overflow=ASYNC_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=ASYNC_POOL_RECYCLE,
+        echo=False
+    )
+
 # Create engine and session
 engine = create_database_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine and session for async def routes, so they never block the event loop on the database
+async_engine = create_async_database_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+async def create_tables():
+    """Create any missing tables; awaited once from the app's lifespan instead of at import"""
+    try:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        print("✅ All tables created (if not already present)")
+    except Exception as e:
+        print(f"❌ Error creating tables: {e}")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -248,6 +279,10 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def test_database_connection():
     try:
         with engine.connect() as connection:
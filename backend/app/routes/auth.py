@@ -9,8 +9,9 @@ import uuid
 from .. import tables as schemas
 from .. import security
 from ..security import get_current_user
-from sqlalchemy.orm import Session
-from ..db.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db.database import get_async_db
 from .. import model as models
 from sqlalchemy import or_
 from ..tables import UserCreate
@@ -24,17 +25,19 @@ UPLOAD_DIR = "uploads"
 
 @router.post("/register", response_model=schemas.Token)
 async def register(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     username: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
     full_name: str = Form(...),
     gender: str = Form(...)
 ):
-    db_user_by_username = db.query(models.User).filter(models.User.username == username).first()
+    result = await db.execute(select(models.User).filter(models.User.username == username))
+    db_user_by_username = result.scalars().first()
     if db_user_by_username:
         raise HTTPException(status_code=400, detail="Username already registered")
-    db_user_by_email = db.query(models.User).filter(models.User.email == email).first()
+    result = await db.execute(select(models.User).filter(models.User.email == email))
+    db_user_by_email = result.scalars().first()
     if db_user_by_email:
         raise HTTPException(status_code=400, detail="Email already registered")
 
@@ -51,8 +54,8 @@ async def register(
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
 
     access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
@@ -65,10 +68,11 @@ async def register(
     }
 
 @router.post("/login", response_model=schemas.Token)
-async def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
-    user_in_db = db.query(models.User).filter(
+async def login(credentials: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(models.User).filter(
         models.User.username == credentials.username
-    ).first()
+    ))
+    user_in_db = result.scalars().first()
 
     if not user_in_db:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, File, UploadFile, APIRouter
+from fastapi import FastAPI, File, UploadFile, APIRouter, Request
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List
 from io import BytesIO
 from PIL import Image
 import numpy as np
+import asyncio
 import json
 import tensorflow as tf
 
+from machine_learning import model_input
+
 
 
 
@@ -18,27 +21,39 @@ with open("ML_Res/class_names.json", "r") as f:
     class_indices = json.load(f)
 class_names = list(class_indices.keys())
 
+input_scale = model_input.input_scale(model)
+
 def predict_class_from_pil(img: Image.Image) -> str:
     img = img.resize((224, 224))
-    arr = np.array(img) / 255.0
+    arr = np.array(img, dtype=np.float32) * input_scale
     x = np.expand_dims(arr, axis=0)
     preds = model.predict(x, verbose=0)
     return class_names[int(np.argmax(preds))]
 
+def predict_class_from_bytes(contents: bytes) -> str:
+    img = Image.open(BytesIO(contents)).convert("RGB")
+    return predict_class_from_pil(img)
+
 @router.post("/predict-multiple/")
 async def predict_multiple(
+    request: Request,
     files: List[UploadFile] = File(...),
 ):
     """
     Accepts multiple image files, returns a list of
     { filename, predicted_class } objects.
     """
-    results = []
-    for file in files:
-        contents = await file.read()
-        img = Image.open(BytesIO(contents)).convert("RGB")
-        cat = predict_class_from_pil(img)
-        results.append({"filename": file.filename, "category": cat})
+    # Decoding and inference run on the app's CPU pool, not the event loop
+    loop = asyncio.get_running_loop()
+    contents = [await file.read() for file in files]
+    categories = await asyncio.gather(*(
+        loop.run_in_executor(request.app.state.cpu_pool, predict_class_from_bytes, data)
+        for data in contents
+    ))
+    results = [
+        {"filename": file.filename, "category": cat}
+        for file, cat in zip(files, categories)
+    ]
     return {"predictions": results}
 
 
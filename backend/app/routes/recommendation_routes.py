@@ -2,8 +2,10 @@
 Recommendation routes for Digital Wardrobe System
 Handles outfit recommendations, weather-based suggestions, and occasion-specific recommendations
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from typing import List, Optional, Dict, Any
+from functools import partial
+import asyncio
 import logging
 
 from ..model import User
@@ -22,15 +24,17 @@ router = APIRouter(prefix="/recommendations", tags=["recommendations"])
 
 @router.get("/recommend-similar/{clothing_item_id}", response_model=List[ClothingItemResponse])
 async def get_similar_items(
+    request: Request,
     clothing_item_id: str,
     top_k: int = Query(5, ge=1, le=10),
     current_user: User = Depends(get_current_user)
 ):
     """Get similar items based on a clothing item"""
     try:
-        recommendations = recommendation_service.recommend_similar_items(
-            item_id=clothing_item_id,
-            top_k=top_k
+        # The lookup and nearest-neighbor search block, so they run on the CPU pool
+        recommendations = await asyncio.get_running_loop().run_in_executor(
+            request.app.state.cpu_pool,
+            partial(recommendation_service.recommend_similar_items, item_id=clothing_item_id, top_k=top_k)
         )
         return recommendations
     except (FileNotFoundError, ValueError) as e:
@@ -1,5 +1,6 @@
 
-from fastapi import UploadFile, APIRouter, File, Depends,Form, HTTPException, Query
+from fastapi import UploadFile, APIRouter, File, Depends,Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional, List
 import uuid
 import os
@@ -9,7 +10,6 @@ import uvicorn
 import logging
 from datetime import datetime
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
 from ..security import get_current_user
@@ -22,7 +22,7 @@ import asyncio
 from ..db.database import get_db, get_database_connection
 from ..tables import ImageMetadata, ImageResponse,BatchUploadResponse,BatchImageMetadata, UpdateCategoryRequest
 from ..security import get_current_user
-from ..utils.image_processing import process_single_image
+from ..utils.image_processing import process_single_image, process_saved_image, new_upload_path, attach_resnet_features
 
 
 
@@ -33,19 +33,38 @@ UPLOAD_DIR = "uploads"
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB per file
 MAX_FILES_PER_REQUEST = 20
 MIN_FILES_PER_REQUEST = 1
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64 KiB reads/writes when saving uploads
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-executor = ThreadPoolExecutor(max_workers=4)
-
 router = APIRouter()
 
 
+async def save_upload(file: UploadFile, filepath: str) -> int:
+    """
+    Streams an upload to filepath in UPLOAD_CHUNK_SIZE chunks, so only one chunk
+    is in memory at a time. Returns the size written; past MAX_FILE_SIZE the
+    partial file is removed and a 400 is raised.
+    """
+    file_size = 0
+    with open(filepath, "wb", buffering=UPLOAD_CHUNK_SIZE) as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            file_size += len(chunk)
+            if file_size > MAX_FILE_SIZE:
+                break
+            await run_in_threadpool(out.write, chunk)
+    if file_size > MAX_FILE_SIZE:
+        os.remove(filepath)
+        raise HTTPException(status_code=400, detail=f"File {file.filename} is too large")
+    return file_size
+
+
 
 @router.post("/upload-image", response_model=ImageResponse)
 async def upload_single_image(
+    request: Request,
     file: UploadFile = File(...),
     style: Optional[str] = Form(None),
     occasion: Optional[str] = Form(None),
@@ -80,7 +99,10 @@ async def upload_single_image(
             "user_id":  current_user.id
         }
         file_data = (contents, file.filename, file.filename)
-        result = process_single_image(file_data, extra_metadata=extra_metadata)
+        # Background removal and ResNet inference run on the app's CPU pool, not the event loop
+        result = await asyncio.get_running_loop().run_in_executor(
+            request.app.state.cpu_pool, process_single_image, file_data, None, extra_metadata
+        )
         
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result["error"])
@@ -232,6 +254,7 @@ def recommend_similar(image_id: str, top_k: int = 5, current_user: User = Depend
 
 @router.post("/upload-images", response_model=BatchUploadResponse)
 async def upload_multiple_images(
+    request: Request,
     files: List[UploadFile] = File(...),
     metadatas: Optional[str] = Form(None), # Expecting a JSON string
     current_user: User = Depends(get_current_user)
@@ -250,39 +273,48 @@ async def upload_multiple_images(
         # Generate batch ID
         batch_id = str(uuid.uuid4())
         
-        # Prepare file data for processing
-        file_data_list = []
+        # Validate file types before anything is written
         for file in files:
-            # Validate file type
             if not file.content_type or not file.content_type.startswith('image/'):
                 raise HTTPException(status_code=400, detail=f"File {file.filename} must be an image")
-            
-            # Check file size
-            contents = await file.read()
-            if len(contents) > MAX_FILE_SIZE:
-                raise HTTPException(status_code=400, detail=f"File {file.filename} is too large")
-            
-            file_data_list.append((contents, file.filename, file.filename))
+        
+        # Save files to disk in chunks rather than reading them all into memory
+        saved_files = []
+        try:
+            for file in files:
+                filepath = new_upload_path(file.filename)
+                file_size = await save_upload(file, filepath)
+                saved_files.append((filepath, file.filename, file_size))
+        except HTTPException:
+            for filepath, _, _ in saved_files:
+                os.remove(filepath)
+            raise
         
         # Process images in parallel
-        logger.info(f"Processing {len(file_data_list)} images in batch {batch_id}")
+        logger.info(f"Processing {len(saved_files)} images in batch {batch_id}")
         
         # Parse metadatas if provided
         metadata_list = json.loads(metadatas) if metadatas else [{}] * len(files)
 
-        # Use ThreadPoolExecutor for parallel processing
-        loop = asyncio.get_event_loop()
+        # Process in parallel on the app's shared CPU pool
+        loop = asyncio.get_running_loop()
         processing_tasks = []
         
-        for i, file_data in enumerate(file_data_list):
+        for i, (filepath, original_name, file_size) in enumerate(saved_files):
             extra_metadata = metadata_list[i] if i < len(metadata_list) else {}
             extra_metadata['user_id'] = current_user.id
-            task = loop.run_in_executor(executor, process_single_image, file_data, batch_id, extra_metadata)
+            task = loop.run_in_executor(
+                request.app.state.cpu_pool, process_saved_image,
+                filepath, original_name, file_size, batch_id, extra_metadata, True
+            )
             processing_tasks.append(task)
         
         # Wait for all processing to complete
         processing_results = await asyncio.gather(*processing_tasks)
         
+        # ResNet50 features for the whole batch in one model call
+        await loop.run_in_executor(request.app.state.cpu_pool, attach_resnet_features, processing_results)
+        
         # Separate successful and failed results
         successful_results = [r for r in processing_results if r["success"]]
         failed_results = [r for r in processing_results if not r["success"]]
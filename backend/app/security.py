@@ -5,13 +5,14 @@ from pydantic import BaseModel
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 import os
 
 from . import tables as schemas  # Pydantic schemas
 from . import model as models    # SQLAlchemy models
-from .db.database import get_db
+from .db.database import get_async_db
 
 # ──────🔐 Load Environment Variables ──────
 load_dotenv()
@@ -57,7 +58,7 @@ def decode_access_token(token: str) -> Optional[TokenData]:
 # ──────🔐 Get Current User ──────
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> schemas.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,7 +72,8 @@ async def get_current_user(
     if token_data is None or token_data.username is None:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
+    result = await db.execute(select(models.User).filter(models.User.username == token_data.username))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
 
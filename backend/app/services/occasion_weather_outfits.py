@@ -5,12 +5,20 @@ from typing import List, Dict, Optional, Tuple, Any
 from dataclasses import dataclass
 from sklearn.metrics.pairwise import cosine_similarity
 import requests
+from requests.adapters import HTTPAdapter
 from pydantic import BaseModel
 import os
 from dotenv import  load_dotenv
 
 load_dotenv()
 
+# One pooled keep-alive session shared by every WeatherService, so each
+# request reuses a connection to OpenWeatherMap instead of opening a new one
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_maxsize=10))
+_SESSION.mount("https://", HTTPAdapter(pool_maxsize=10))
+REQUEST_TIMEOUT = (3, 5)  # (connect, read) seconds
+
 @dataclass
 class ClothingItem:
     """Represents a single clothing item with all its attributes"""
@@ -84,7 +92,7 @@ class WeatherService:
         }
         
         try:
-            response = requests.get(self.base_url, params=params)
+            response = _SESSION.get(self.base_url, params=params, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             data = response.json()
             
@@ -106,11 +114,11 @@ class WeatherService:
 
     def get_coordinates(self, city: str, country_code: Optional[str] = None) -> Tuple[float, float]:
         loc = f"{city},{country_code}" if country_code else city
-        resp = requests.get(self.geo_url, params={
+        resp = _SESSION.get(self.geo_url, params={
             "q": loc,
             "limit": 1,
             "appid": self.api_key
-        })
+        }, timeout=REQUEST_TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
         if not data:
@@ -119,12 +127,12 @@ class WeatherService:
 
     def get_daily_forecast(self, city: str, country_code: Optional[str] = None) -> List[Dict]:
         lat, lon = self.get_coordinates(city, country_code)
-        resp = requests.get(self.forecast_url, params={
+        resp = _SESSION.get(self.forecast_url, params={
             "lat": lat,
             "lon": lon,
             "units": "metric",
             "appid": self.api_key
-        })
+        }, timeout=REQUEST_TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
         # data["list"] is a list of 3‑hour forecasts; group them by date:
@@ -1,32 +1,112 @@
 import os
+import glob
+import logging
+import threading
 import joblib
 import numpy as np
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from sklearn.neighbors import NearestNeighbors
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
 from .database_service import db_service, ClothingItemResponse
 
 
 # Configuration
 ML_READY_DIR = "ML_Ready"
 KNN_TEMPLATE = "knn_{category}.joblib"
+FAISS_TEMPLATE = "faiss_{category}.index"
+FAISS_EF_SEARCH = 64  # HNSW candidate list size per query
+KNN_PRELOAD_WORKERS = 8
+
+logger = logging.getLogger(__name__)
 
 
 class RecommendationService:
-    def __init__(self):
+    def __init__(self, preload: bool = True):
         self._knn_cache = {}
+        self._faiss_cache = {}
+        self._knn_locks = {}
+        self._locks_guard = threading.Lock()
+        if preload:
+            self.preload_knn_models()
+
+    def _category_lock(self, category: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._knn_locks.setdefault(category, threading.Lock())
 
     def get_knn_model(self, category: str) -> NearestNeighbors:
         """
         Loads a KNN model for a specific category, caching it for future use.
         """
         if category not in self._knn_cache:
-            model_path = os.path.join(ML_READY_DIR, KNN_TEMPLATE.format(category=category))
-            if not os.path.exists(model_path):
-                raise FileNotFoundError(f"KNN model for category '{category}' not found.")
-            self._knn_cache[category] = joblib.load(model_path)
+            # One load per category even if a request races the background preload
+            with self._category_lock(category):
+                if category not in self._knn_cache:
+                    model_path = os.path.join(ML_READY_DIR, KNN_TEMPLATE.format(category=category))
+                    if not os.path.exists(model_path):
+                        raise FileNotFoundError(f"KNN model for category '{category}' not found.")
+                    self._knn_cache[category] = joblib.load(model_path)
         return self._knn_cache[category]
 
+    def get_faiss_index(self, category: str) -> Optional["faiss.Index"]:
+        """
+        Loads the FAISS HNSW index for a category, or None when FAISS or the index is missing.
+        """
+        if faiss is None:
+            return None
+        if category not in self._faiss_cache:
+            with self._category_lock(category):
+                if category not in self._faiss_cache:
+                    index_path = os.path.join(ML_READY_DIR, FAISS_TEMPLATE.format(category=category))
+                    index = None
+                    if os.path.exists(index_path):
+                        index = faiss.read_index(index_path)
+                        index.hnsw.efSearch = FAISS_EF_SEARCH
+                    self._faiss_cache[category] = index
+        return self._faiss_cache[category]
+
+    def nearest_neighbors(self, category: str, query_features: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores and indices of the k nearest items in a category, via the
+        FAISS index (inner-product similarity) when one was built and the
+        KNN model (cosine distance) otherwise.
+        """
+        index = self.get_faiss_index(category)
+        if index is None:
+            return self.get_knn_model(category).kneighbors(query_features, n_neighbors=k)
+        distances, indices = index.search(np.ascontiguousarray(query_features, dtype=np.float32), k)
+        found = indices[0] >= 0  # HNSW pads with -1 when the category has fewer than k items
+        return distances[:, found], indices[:, found]
+
+    def preload_knn_models(self) -> None:
+        """
+        Starts loading every KNN model (or its FAISS index, when available) in
+        ML_READY_DIR in background threads, so the first request for a category
+        does not pay for deserialization.
+        """
+        prefix, suffix = KNN_TEMPLATE.split("{category}")
+        paths = glob.glob(os.path.join(ML_READY_DIR, KNN_TEMPLATE.format(category="*")))
+        categories = [os.path.basename(p)[len(prefix):-len(suffix)] for p in paths]
+        if not categories:
+            return
+
+        def load(category: str) -> None:
+            try:
+                if self.get_faiss_index(category) is None:
+                    self.get_knn_model(category)
+            except Exception as e:
+                logger.warning(f"Could not preload KNN model for '{category}': {e}")
+
+        executor = ThreadPoolExecutor(max_workers=KNN_PRELOAD_WORKERS, thread_name_prefix="knn-preload")
+        for category in categories:
+            executor.submit(load, category)
+        executor.shutdown(wait=False)
+
     def recommend_similar_items(self, item_id: str, top_k: int = 5) -> List[ClothingItemResponse]:
         """
         Recommends items similar to a given item based on its ResNet features.
@@ -44,13 +124,10 @@ class RecommendationService:
         category = target_item.clothing_type_name
         query_features = np.array(target_item.resnet_features).reshape(1, -1)
 
-        # 2. Load the corresponding KNN model
-        knn_model = self.get_knn_model(category)
-
-        # 3. Find the nearest neighbors
-        distances, indices = knn_model.kneighbors(query_features, n_neighbors=top_k + 1)
+        # 2. Find the nearest neighbors with the category's index
+        distances, indices = self.nearest_neighbors(category, query_features, top_k + 1)
 
-        # 4. Get the item IDs from the file map
+        # 3. Get the item IDs from the file map
         # This part needs to be adapted to your new database structure.
         # Assuming you have a way to map the indices back to your database item IDs.
         # For now, I'll simulate this with a placeholder.
@@ -63,7 +140,7 @@ class RecommendationService:
         
         recommended_item_ids = [all_items_in_category[i].id for i in indices[0]]
         
-        # 5. Exclude the query item itself and fetch the details of the recommended items
+        # 4. Exclude the query item itself and fetch the details of the recommended items
         recommended_items = []
         for recommended_id in recommended_item_ids:
             if recommended_id != item_id:
@@ -0,0 +1,69 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+
+# Add the backend directory to the Python path; color_utils is imported under
+# the same module name as in the app, so Numba's on-disk cache stays valid
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.utils.color_utils import closest_color, closest_colors, rgb_to_hex, local_binary_pattern
+
+
+def lbp_reference(img, radius=1, n_points=8):
+    """The per-pixel LBP loop local_binary_pattern replaced"""
+    h, w = img.shape
+    lbp_img = np.zeros((h, w), dtype=np.uint8)
+    for i in range(radius, h - radius):
+        for j in range(radius, w - radius):
+            center = img[i, j]
+            binary_string = ""
+            for p in range(n_points):
+                angle = 2 * np.pi * p / n_points
+                x = int(i + radius * np.cos(angle))
+                y = int(j + radius * np.sin(angle))
+                binary_string += "1" if img[x, y] >= center else "0"
+            lbp_img[i, j] = int(binary_string, 2)
+    return lbp_img
+
+
+class TestColorUtils(unittest.TestCase):
+
+    def test_closest_color_pinned_matches(self):
+        self.assertEqual(closest_color((250, 10, 10)), 'red')
+        self.assertEqual(closest_color((254, 254, 254)), 'white')
+        self.assertEqual(closest_color((1, 1, 1)), 'black')
+        self.assertEqual(closest_color((240, 230, 135)), 'khaki')
+        self.assertEqual(closest_color((100, 149, 238)), 'cornflowerblue')
+
+    def test_closest_colors_matches_closest_color(self):
+        rng = np.random.default_rng(0)
+        colors = [tuple(int(c) for c in rgb) for rgb in rng.integers(0, 256, size=(200, 3))]
+        self.assertEqual(closest_colors(colors), [closest_color(rgb) for rgb in colors])
+
+    def test_rgb_to_hex(self):
+        self.assertEqual(rgb_to_hex(255, 255, 255), '#ffffff')
+        self.assertEqual(rgb_to_hex(16.7, 0, 128), '#100080')
+
+    def test_rgb_to_hex_clamps_out_of_range_channels(self):
+        self.assertEqual(rgb_to_hex(-5, 300, 16), '#00ff10')
+        self.assertEqual(rgb_to_hex(256, -1, 255), '#ff00ff')
+
+
+class TestLocalBinaryPattern(unittest.TestCase):
+
+    def test_matches_per_pixel_loop(self):
+        rng = np.random.default_rng(0)
+        for shape in [(12, 17), (5, 5), (3, 9)]:
+            img = rng.integers(0, 256, size=shape, dtype=np.uint8)
+            np.testing.assert_array_equal(local_binary_pattern(img), lbp_reference(img))
+
+    def test_flat_image(self):
+        img = np.full((6, 6), 7, dtype=np.uint8)
+        np.testing.assert_array_equal(local_binary_pattern(img), lbp_reference(img))
+
+
+if __name__ == '__main__':
+    unittest.main()
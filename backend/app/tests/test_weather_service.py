@@ -1,4 +1,4 @@
-=# import pytest
+# import pytest
 # import pytest_asyncio # Not strictly needed for @pytest.mark.asyncio but good for consistency
 # import httpx
 # from fastapi import HTTPException
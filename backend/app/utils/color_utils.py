@@ -1,8 +1,63 @@
 # utils/color_utils.py
 import webcolors
 import numpy as np
+import cv2
 from typing import Tuple, Dict, List
-import colorsys
+import functools
+from scipy.spatial import cKDTree
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _maybe_njit(func):
+    """Compile func with Numba when it is installed, otherwise run it as plain Python"""
+    return njit(cache=True)(func) if njit is not None else func
+
+
+# Compiled drop-ins for colorsys.rgb_to_hsv / hsv_to_rgb (same formulas, 0-1 ranges)
+@_maybe_njit
+def _rgb_to_hsv(r: float, g: float, b: float) -> Tuple[float, float, float]:
+    maxc = max(r, g, b)
+    minc = min(r, g, b)
+    if minc == maxc:
+        return 0.0, 0.0, maxc
+    rangec = maxc - minc
+    s = rangec / maxc
+    rc = (maxc - r) / rangec
+    gc = (maxc - g) / rangec
+    bc = (maxc - b) / rangec
+    if r == maxc:
+        h = bc - gc
+    elif g == maxc:
+        h = 2.0 + rc - bc
+    else:
+        h = 4.0 + gc - rc
+    return (h / 6.0) % 1.0, s, maxc
+
+@_maybe_njit
+def _hsv_to_rgb(h: float, s: float, v: float) -> Tuple[float, float, float]:
+    if s == 0.0:
+        return v, v, v
+    i = int(h * 6.0)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i % 6
+    if i == 0:
+        return v, t, p
+    if i == 1:
+        return q, v, p
+    if i == 2:
+        return p, v, t
+    if i == 3:
+        return p, q, v
+    if i == 4:
+        return t, p, v
+    return v, p, q
 
 
 def get_all_css3_colors() -> Dict[str, str]:
@@ -60,39 +115,98 @@ def get_all_css3_colors() -> Dict[str, str]:
     }
 
 
+# Two-digit hex of every channel value, so rgb_to_hex only concatenates
+_HEX2 = tuple(f"{i:02x}" for i in range(256))
+
 def rgb_to_hex(r: float, g: float, b: float) -> str:
-    """Convert RGB values to HEX format"""
-    return "#{:02x}{:02x}{:02x}".format(int(r), int(g), int(b))
+    """Convert RGB values to HEX format (channels clamped to 0-255)"""
+    r, g, b = int(r), int(g), int(b)
+    # clamping only on the rare out-of-range call keeps the common path to three lookups
+    if not (0 <= r <= 255 and 0 <= g <= 255 and 0 <= b <= 255):
+        r, g, b = (max(0, min(255, c)) for c in (r, g, b))
+    return "#" + _HEX2[r] + _HEX2[g] + _HEX2[b]
 
 def hex_to_rgb(hex_code: str) -> Tuple[int, int, int]:
     """Convert HEX to RGB"""
     return webcolors.hex_to_rgb(hex_code)
 
+def _rgb_to_lab(rgb) -> np.ndarray:
+    """(N, 3) RGB in 0-255 to (N, 3) CIELab (L in 0-100)"""
+    rgb = np.clip(np.asarray(rgb, dtype=np.float32).reshape(-1, 1, 3), 0, 255) / 255.0
+    if not len(rgb):
+        return np.empty((0, 3))
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB).reshape(-1, 3).astype(np.float64)
+
+# The CSS3 table, built and parsed once at import: names and RGB rows in the
+# same order. Shared with wardrobe_utils instead of keeping a second copy.
+CSS3_TABLE = get_all_css3_colors()
+CSS3_NAMES = tuple(CSS3_TABLE)
+CSS3_RGB = np.array([webcolors.hex_to_rgb(hex_code) for hex_code in CSS3_TABLE.values()], dtype=np.int16)
+
+# closest_color compares in CIELab: distances there follow perceived color
+# difference far better than RGB
+_CSS3_LAB = _rgb_to_lab(CSS3_RGB)
+
+@_maybe_njit
+def _argmin_sqdist(q: np.ndarray, table: np.ndarray) -> int:
+    """Row of table nearest to q by squared distance; ties go to the first row"""
+    best = np.inf
+    idx = 0
+    for i in range(table.shape[0]):
+        d0 = table[i, 0] - q[0]
+        d1 = table[i, 1] - q[1]
+        d2 = table[i, 2] - q[2]
+        d = d0 * d0 + d1 * d1 + d2 * d2
+        if d < best:
+            best = d
+            idx = i
+    return idx
+
+# compile now rather than on the first lookup
+_argmin_sqdist(_CSS3_LAB[0], _CSS3_LAB)
+
 def closest_color(requested_rgb: Tuple[float, float, float]) -> str:
     """Find the closest CSS3 color name for given RGB values"""
-    min_distance = float("inf")
-    closest_name = None
-    
-    for name, hex_code in get_all_css3_colors().items():
-        r_c, g_c, b_c = webcolors.hex_to_rgb(hex_code)
-        rd = (r_c - requested_rgb[0]) ** 2
-        gd = (g_c - requested_rgb[1]) ** 2
-        bd = (b_c - requested_rgb[2]) ** 2
-        distance = rd + gd + bd
-        
-        if distance < min_distance:
-            min_distance = distance
-            closest_name = name
-    
-    return closest_name
+    # squared Lab distance to every reference color in one flat loop, without temporaries
+    return CSS3_NAMES[_argmin_sqdist(_rgb_to_lab(requested_rgb)[0], _CSS3_LAB)]
+
+# k-d tree over the distinct reference colors (first name wins, as in closest_color),
+# for looking up several colors at once
+_, _first = np.unique(CSS3_RGB, axis=0, return_index=True)
+_CSS3_TREE_NAMES = [CSS3_NAMES[i] for i in sorted(_first)]
+_CSS3_TREE = cKDTree(_CSS3_LAB[sorted(_first)])
+
+def closest_colors(requested_rgbs: List[Tuple[float, float, float]]) -> List[str]:
+    """closest_color for many RGB values in one k-d tree query"""
+    _, idx = _CSS3_TREE.query(_rgb_to_lab(requested_rgbs))
+    return [_CSS3_TREE_NAMES[i] for i in idx]
 
 def get_color_name(rgb_triplet: List[float]) -> str:
     """Get color name from RGB values"""
+    # Centroid colors repeat across images; lists are not hashable, tuples are
+    return _cached_color_name(tuple(rgb_triplet))
+
+@functools.lru_cache(maxsize=4096)
+def _cached_color_name(rgb_triplet: Tuple[float, float, float]) -> str:
     try:
         return webcolors.rgb_to_name(tuple(map(int, rgb_triplet)), spec='css3')
     except ValueError:
         return closest_color(rgb_triplet)
 
+def get_color_names(rgb_triplets: List[List[float]]) -> List[str]:
+    """get_color_name for many RGB values; the inexact ones share one tree query"""
+    names, missing = [], []
+    for i, rgb in enumerate(rgb_triplets):
+        try:
+            names.append(webcolors.rgb_to_name(tuple(map(int, rgb)), spec='css3'))
+        except ValueError:
+            names.append(None)
+            missing.append(i)
+    if missing:
+        for i, name in zip(missing, closest_colors([rgb_triplets[i] for i in missing])):
+            names[i] = name
+    return names
+
 def get_tone(rgb_triplet: List[float]) -> str:
     """Determine if color is light or dark"""
     r, g, b = rgb_triplet
@@ -118,7 +232,7 @@ def get_temperature(rgb_triplet: List[float]) -> str:
 def get_saturation(rgb_triplet: List[float]) -> str:
     """Get color saturation level"""
     r, g, b = [x/255.0 for x in rgb_triplet]
-    h, s, v = colorsys.rgb_to_hsv(r, g, b)
+    h, s, v = _rgb_to_hsv(r, g, b)
     
     if s > 0.7:
         return "High"
@@ -131,7 +245,7 @@ def get_color_harmony(color1_rgb: List[float], color2_rgb: List[float]) -> str:
     """Determine color harmony relationship between two colors"""
     def rgb_to_hue(rgb):
         r, g, b = [x/255.0 for x in rgb]
-        h, s, v = colorsys.rgb_to_hsv(r, g, b)
+        h, s, v = _rgb_to_hsv(r, g, b)
         return h * 360
     
     hue1 = rgb_to_hue(color1_rgb)
@@ -165,25 +279,54 @@ def colors_match(color1_rgb: List[float], color2_rgb: List[float]) -> bool:
     
     return temp_match and (harmony_match or tone_contrast)
 
-def get_color_palette(rgb_triplet: List[float]) -> Dict[str, str]:
-    """Get a color palette based on the input color"""
-    r, g, b = [x/255.0 for x in rgb_triplet]
-    h, s, v = colorsys.rgb_to_hsv(r, g, b)
+@_maybe_njit
+def _palette_rgb(r: float, g: float, b: float):
+    """Complementary and ±30° analogous colors of an RGB color, in one compiled call (channels 0-255)"""
+    h, s, v = _rgb_to_hsv(r / 255.0, g / 255.0, b / 255.0)
     
     # Generate complementary color
     comp_h = (h + 0.5) % 1.0
-    comp_r, comp_g, comp_b = colorsys.hsv_to_rgb(comp_h, s, v)
+    comp_r, comp_g, comp_b = _hsv_to_rgb(comp_h, s, v)
     
     # Generate analogous colors
     analog1_h = (h + 0.083) % 1.0  # +30 degrees
     analog2_h = (h - 0.083) % 1.0  # -30 degrees
     
-    analog1_r, analog1_g, analog1_b = colorsys.hsv_to_rgb(analog1_h, s, v)
-    analog2_r, analog2_g, analog2_b = colorsys.hsv_to_rgb(analog2_h, s, v)
+    analog1_r, analog1_g, analog1_b = _hsv_to_rgb(analog1_h, s, v)
+    analog2_r, analog2_g, analog2_b = _hsv_to_rgb(analog2_h, s, v)
+    
+    return ((comp_r*255, comp_g*255, comp_b*255),
+            (analog1_r*255, analog1_g*255, analog1_b*255),
+            (analog2_r*255, analog2_g*255, analog2_b*255))
+
+def get_color_palette(rgb_triplet: List[float]) -> Dict[str, str]:
+    """Get a color palette based on the input color"""
+    r, g, b = rgb_triplet
+    complementary, analogous1, analogous2 = _palette_rgb(float(r), float(g), float(b))
     
     return {
         "original": rgb_to_hex(*rgb_triplet),
-        "complementary": rgb_to_hex(comp_r*255, comp_g*255, comp_b*255),
-        "analogous1": rgb_to_hex(analog1_r*255, analog1_g*255, analog1_b*255),
-        "analogous2": rgb_to_hex(analog2_r*255, analog2_g*255, analog2_b*255)
-    }
\ No newline at end of file
+        "complementary": rgb_to_hex(*complementary),
+        "analogous1": rgb_to_hex(*analogous1),
+        "analogous2": rgb_to_hex(*analogous2)
+    }
+
+def local_binary_pattern(img: np.ndarray, radius: int = 1, n_points: int = 8) -> np.ndarray:
+    """LBP code of every pixel of a grayscale image (0 on the radius-wide border)"""
+    h, w = img.shape
+    lbp_img = np.zeros((h, w), dtype=np.uint8)
+    rows = np.arange(radius, h - radius)
+    cols = np.arange(radius, w - radius)
+    center = img[radius:h - radius, radius:w - radius]
+
+    # One whole-image comparison per sampling point, most significant bit first
+    code = np.zeros(center.shape, dtype=np.uint8)
+    for p in range(n_points):
+        angle = 2 * np.pi * p / n_points
+        # Same truncated sampling positions as int(i + radius * cos(angle))
+        x = (rows + radius * np.cos(angle)).astype(int)
+        y = (cols + radius * np.sin(angle)).astype(int)
+        code = (code << 1) | (img[x[:, None], y[None, :]] >= center)
+
+    lbp_img[radius:h - radius, radius:w - radius] = code
+    return lbp_img
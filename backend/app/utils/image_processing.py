@@ -1,6 +1,5 @@
 
 from rembg import remove, new_session
-from sklearn.cluster import KMeans
 import tempfile
 import uuid
 import os
@@ -59,6 +58,12 @@ except Exception as e:
     resnet_model = None
 
 
+# Fixed input signature: one traced graph serves every batch size
+@tf.function(input_signature=[tf.TensorSpec([None, 224, 224, 3], tf.float32)])
+def resnet_batch_features(batch):
+    return resnet_model(batch, training=False)
+
+
 
 
 def extract_color_features(image_path):
@@ -422,6 +427,12 @@ def extract_color_features_original(image_path):
 
 
 # Image processing functions
+def load_resnet_input(image_path):
+    """Load and preprocess an image into a (224, 224, 3) ResNet50 input"""
+    img = image.load_img(image_path, target_size=(224, 224))
+    return preprocess_input(image.img_to_array(img))
+
+
 def extract_resnet_features(image_path):
     """Extract features using ResNet50"""
     try:
@@ -429,10 +440,7 @@ def extract_resnet_features(image_path):
             raise Exception("ResNet50 model not available")
         
         # Load and preprocess image
-        img = image.load_img(image_path, target_size=(224, 224))
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = preprocess_input(img_array)
+        img_array = np.expand_dims(load_resnet_input(image_path), axis=0)
         
         # Extract features
         features = resnet_model.predict(img_array)
@@ -442,6 +450,27 @@ def extract_resnet_features(image_path):
         logger.error(f"Error extracting ResNet features: {str(e)}")
         return []
 
+
+def attach_resnet_features(results):
+    """
+    Fill in resnet_features for results from process_saved_image(defer_resnet=True)
+    with a single batched ResNet50 call over all their preprocessed inputs
+    """
+    pending = [r for r in results if r["success"]]
+    if not pending:
+        return
+    inputs = [r.pop("resnet_input") for r in pending]
+    try:
+        if resnet_model is None:
+            raise Exception("ResNet50 model not available")
+        features = resnet_batch_features(np.stack(inputs).astype(np.float32)).numpy()
+        for result, row in zip(pending, features):
+            result["metadata"]["resnet_features"] = row.tolist()
+    except Exception as e:
+        logger.error(f"Error extracting batched ResNet features: {str(e)}")
+        for result in pending:
+            result["metadata"]["resnet_features"] = []
+
 def extract_opencv_features(image_path):
     """Extract features using OpenCV"""
     try:
@@ -493,22 +522,41 @@ def extract_opencv_features(image_path):
 
 
 
+def new_upload_path(original_name):
+    """Unique path in UPLOAD_DIR for an upload, keeping its extension"""
+    file_extension = os.path.splitext(original_name)[1]
+    return os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{file_extension}")
+
+
 def process_single_image(file_data, batch_id=None, extra_metadata=None):
     """Process a single image - used for parallel processing"""
-    if extra_metadata is None:
-        extra_metadata = {}
+    file_content, filename, original_name = file_data
     try:
-        file_content, filename, original_name = file_data
-        
-        # Generate unique filename
-        file_extension = os.path.splitext(original_name)[1]
-        unique_filename = f"{uuid.uuid4().hex}{file_extension}"
-        filepath = os.path.join(UPLOAD_DIR, unique_filename)
-        
         # Save file
+        filepath = new_upload_path(original_name)
         with open(filepath, "wb") as f:
             f.write(file_content)
-        
+    except Exception as e:
+        logger.error(f"Error processing image {original_name}: {str(e)}")
+        return {
+            "success": False,
+            "error": str(e),
+            "original_name": original_name
+        }
+    return process_saved_image(filepath, original_name, len(file_content), batch_id, extra_metadata)
+
+
+def process_saved_image(filepath, original_name, file_size, batch_id=None, extra_metadata=None, defer_resnet=False):
+    """
+    Process an image already written to UPLOAD_DIR - used for parallel processing.
+    With defer_resnet, ResNet50 is not run: the result carries the preprocessed
+    "resnet_input" for attach_resnet_features to batch across images.
+    """
+    if extra_metadata is None:
+        extra_metadata = {}
+    try:
+        unique_filename = os.path.basename(filepath)
+
         # Get image dimensions
         width, height = get_image_dimensions(filepath)
         
@@ -518,7 +566,11 @@ def process_single_image(file_data, batch_id=None, extra_metadata=None):
         clothing_part = CATEGORY_TO_PART.get(category, "unknown")
         
         # Extract features
-        resnet_features = extract_resnet_features(filepath)
+        if defer_resnet:
+            resnet_input = load_resnet_input(filepath)
+            resnet_features = None
+        else:
+            resnet_features = extract_resnet_features(filepath)
         opencv_features = extract_opencv_features(filepath)
         
         # Extract color features with background removal
@@ -530,7 +582,7 @@ def process_single_image(file_data, batch_id=None, extra_metadata=None):
             "id": image_id,
             "filename": unique_filename,
             "original_name": original_name,
-            "file_size": len(file_content),
+            "file_size": file_size,
             "image_width": width,
             "image_height": height,
             "dominant_color": color_features["dominant_color"],
@@ -553,12 +605,15 @@ def process_single_image(file_data, batch_id=None, extra_metadata=None):
             "user_id": extra_metadata.get("user_id")
         }
         
-        return {
+        result = {
             "success": True,
             "metadata": metadata,
             "filepath": filepath,
             "color_features": color_features
         }
+        if defer_resnet:
+            result["resnet_input"] = resnet_input
+        return result
         
     except Exception as e:
         logger.error(f"Error processing image {original_name}: {str(e)}")
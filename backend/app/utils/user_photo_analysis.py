@@ -3,10 +3,115 @@ import numpy as np
 import mediapipe as mp
 from typing import Dict, List, Tuple, Optional
 import json
-from sklearn.cluster import KMeans
 import math
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _maybe_njit(func):
+    """Compile func with Numba when it is installed, otherwise run it as plain Python"""
+    return njit(cache=True)(func) if njit is not None else func
+
+
+# Body parts used for measurements, in key-point array order, with their
+# MediaPipe Pose landmark indices
+KEY_POINT_LANDMARKS = {
+    'nose': 0,
+    'left_shoulder': 11,
+    'right_shoulder': 12,
+    'left_elbow': 13,
+    'right_elbow': 14,
+    'left_wrist': 15,
+    'right_wrist': 16,
+    'left_hip': 23,
+    'right_hip': 24,
+    'left_knee': 25,
+    'right_knee': 26,
+    'left_ankle': 27,
+    'right_ankle': 28
+}
+KEY_POINT_NAMES = tuple(KEY_POINT_LANDMARKS)
+KEY_POINT_INDICES = np.array(tuple(KEY_POINT_LANDMARKS.values()))
+_NOSE, _L_SHOULDER, _R_SHOULDER = 0, 1, 2
+_L_HIP, _R_HIP = 7, 8
+_L_ANKLE, _R_ANKLE = 11, 12
+
+# Skin tone buckets by perceived brightness (0.299 R + 0.587 G + 0.114 B)
+_BRIGHTNESS_WEIGHTS = np.array([0.299, 0.587, 0.114])
+SKIN_TONE_THRESHOLDS = np.array([50, 80, 110, 140, 170, 200])
+SKIN_TONE_LABELS = np.array([
+    "very_dark", "dark", "medium_dark", "medium", "medium_light", "light", "very_light"
+])
+
+BODY_TYPES = ("unknown", "inverted_triangle", "pear", "hourglass", "apple", "rectangle")
+
+
+@_maybe_njit
+def _measure_key_points(kp):
+    """Shoulder, hip and waist width and body height from a (13, 2) key-point array.
+
+    Missing key points are NaN, and so is every measurement that needs them.
+    """
+    dx = kp[_L_SHOULDER, 0] - kp[_R_SHOULDER, 0]
+    dy = kp[_L_SHOULDER, 1] - kp[_R_SHOULDER, 1]
+    shoulder_width = np.sqrt(dx * dx + dy * dy)
+
+    dx = kp[_L_HIP, 0] - kp[_R_HIP, 0]
+    dy = kp[_L_HIP, 1] - kp[_R_HIP, 1]
+    hip_width = np.sqrt(dx * dx + dy * dy)
+
+    # Waist is approximated from the shoulders when the torso is fully visible
+    waist_width = np.nan
+    if not np.isnan(shoulder_width) and not np.isnan(hip_width):
+        waist_width = shoulder_width * 0.8
+
+    left_ankle_y = kp[_L_ANKLE, 1]
+    right_ankle_y = kp[_R_ANKLE, 1]
+    if np.isnan(left_ankle_y):
+        ankle_y = right_ankle_y
+    elif np.isnan(right_ankle_y):
+        ankle_y = left_ankle_y
+    else:
+        ankle_y = min(left_ankle_y, right_ankle_y)
+    body_height = ankle_y - kp[_NOSE, 1]
+
+    return shoulder_width, hip_width, waist_width, body_height
+
+
+@_maybe_njit
+def _classify_body_shape(shoulder_width, waist_width, hip_width):
+    """Index into BODY_TYPES for the given widths"""
+    if shoulder_width == 0 or hip_width == 0:
+        return 0
+
+    shoulder_hip_ratio = shoulder_width / hip_width
+    waist_hip_ratio = waist_width / hip_width if hip_width > 0 else 0.0
+    waist_shoulder_ratio = waist_width / shoulder_width if shoulder_width > 0 else 0.0
+
+    if shoulder_hip_ratio > 1.05:
+        return 1
+    elif shoulder_hip_ratio < 0.95:
+        return 2
+    elif waist_hip_ratio < 0.75 and waist_shoulder_ratio < 0.75:
+        return 3
+    elif waist_hip_ratio > 0.85:
+        return 4
+    else:
+        return 5
+
 
 class PhotoProcessingService:
+    # Longest side of the images fed to MediaPipe; inference cost scales with area
+    LANDMARK_MAX_SIDE = 640
+    # Skin-tone results kept per image content digest (the same profile photo is resubmitted often)
+    SKIN_TONE_CACHE_SIZE = 1024
+
     def __init__(self):
         self.mp_pose = mp.solutions.pose
         self.pose = self.mp_pose.Pose(
@@ -15,6 +120,9 @@ class PhotoProcessingService:
             enable_segmentation=True,
             min_detection_confidence=0.5
         )
+        # blake2b digest of the file bytes -> extract_skin_tone result, in LRU order
+        self._skin_tone_cache: "OrderedDict[bytes, Dict]" = OrderedDict()
+        self._skin_tone_cache_lock = threading.Lock()
         self.mp_face_mesh = mp.solutions.face_mesh
         self.face_mesh = self.mp_face_mesh.FaceMesh(
             static_image_mode=True,
@@ -23,35 +131,72 @@ class PhotoProcessingService:
             min_detection_confidence=0.5
         )
     
+    def _rgb_for_landmarks(self, img: np.ndarray) -> np.ndarray:
+        """RGB copy of a BGR image for MediaPipe, downscaled to LANDMARK_MAX_SIDE"""
+        scale = self.LANDMARK_MAX_SIDE / max(img.shape[:2])
+        if scale < 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    
     def extract_skin_tone(self, image_path: str) -> Dict[str, any]:
-        """Extract dominant skin tone from image"""
+        """Extract dominant skin tone from image, reusing the result for identical file contents"""
         try:
-            img = cv2.imread(image_path)
+            with open(image_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return {"error": "Could not load image"}
+        
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        with self._skin_tone_cache_lock:
+            cached = self._skin_tone_cache.get(digest)
+            if cached is not None:
+                self._skin_tone_cache.move_to_end(digest)
+        if cached is not None:
+            return {**cached, "rgb_values": list(cached["rgb_values"])}
+        
+        # Decoded outside the lock; a concurrent miss on the same image just
+        # computes the same result twice
+        result = self._skin_tone_from_bytes(data)
+        if result.get("success"):
+            with self._skin_tone_cache_lock:
+                self._skin_tone_cache[digest] = result
+                if len(self._skin_tone_cache) > self.SKIN_TONE_CACHE_SIZE:
+                    self._skin_tone_cache.popitem(last=False)
+            result = {**result, "rgb_values": list(result["rgb_values"])}
+        return result
+    
+    def _skin_tone_from_bytes(self, data: bytes) -> Dict[str, any]:
+        """Decode an encoded image and extract its dominant skin tone"""
+        try:
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
             if img is None:
                 return {"error": "Could not load image"}
             
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            
-            # Use face detection to focus on face area for better skin tone extraction
-            results = self.face_mesh.process(img_rgb)
+            # Use face detection to focus on face area for better skin tone extraction.
+            # Only the (downscaled) detector input is converted to RGB; the crop and
+            # LAB conversion below work on the original BGR pixels.
+            results = self.face_mesh.process(self._rgb_for_landmarks(img))
             
             if results.multi_face_landmarks:
                 # Extract face region
-                h, w, _ = img_rgb.shape
+                h, w, _ = img.shape
                 face_landmarks = results.multi_face_landmarks[0]
                 
-                # Get face bounding box
-                x_coords = [int(landmark.x * w) for landmark in face_landmarks.landmark]
-                y_coords = [int(landmark.y * h) for landmark in face_landmarks.landmark]
-                
-                x_min, x_max = min(x_coords), max(x_coords)
-                y_min, y_max = min(y_coords), max(y_coords)
+                # Get face bounding box, clipped to the image
+                landmarks = face_landmarks.landmark
+                points = np.fromiter(
+                    (c for landmark in landmarks for c in (landmark.x, landmark.y)),
+                    dtype=np.float32, count=2 * len(landmarks)
+                ).reshape(-1, 2)
+                points = (points * (w, h)).astype(int)
+                x_min, y_min = np.clip(points.min(axis=0), 0, (w, h))
+                x_max, y_max = np.clip(points.max(axis=0), 0, (w, h))
                 
                 # Extract face region
-                face_region = img_rgb[y_min:y_max, x_min:x_max]
+                face_region = img[y_min:y_max, x_min:x_max]
                 
                 # Convert to LAB color space for better skin tone analysis
-                lab_image = cv2.cvtColor(face_region, cv2.COLOR_RGB2LAB)
+                lab_image = cv2.cvtColor(face_region, cv2.COLOR_BGR2LAB)
                 
                 # Create mask for skin-like colors
                 lower_skin = np.array([20, 133, 77], dtype=np.uint8)
@@ -62,19 +207,19 @@ class PhotoProcessingService:
                 skin_pixels = face_region[mask > 0]
                 
                 if len(skin_pixels) > 0:
-                    # Get dominant color using K-means
-                    skin_pixels = skin_pixels.reshape(-1, 3)
-                    kmeans = KMeans(n_clusters=1, random_state=42, n_init=10)
-                    kmeans.fit(skin_pixels)
-                    dominant_color = kmeans.cluster_centers_[0].astype(int)
+                    # Dominant color of a single cluster is simply the mean
+                    dominant_color = skin_pixels.reshape(-1, 3).mean(axis=0).astype(int)
                 else:
                     # Fallback to face region mean
                     dominant_color = face_region.reshape(-1, 3).mean(axis=0).astype(int)
             else:
                 # Fallback to overall image analysis
-                img_resized = cv2.resize(img_rgb, (224, 224))
+                img_resized = cv2.resize(img, (224, 224))
                 dominant_color = img_resized.reshape(-1, 3).mean(axis=0).astype(int)
             
+            # Pixels were averaged in BGR order
+            dominant_color = dominant_color[::-1]
+            
             # Convert to skin tone category
             skin_tone_category = self._classify_skin_tone(dominant_color)
             
@@ -89,28 +234,12 @@ class PhotoProcessingService:
             return {"error": str(e), "success": False}
     
     def _classify_skin_tone(self, rgb_color: np.ndarray) -> str:
-        """Classify RGB color into skin tone categories"""
-        # Convert RGB to ITA (Individual Typology Angle) for skin tone classification
-        r, g, b = rgb_color
-        
-        # Calculate brightness
-        brightness = (0.299 * r + 0.587 * g + 0.114 * b)
-        
-        # Skin tone classification based on brightness and color values
-        if brightness > 200:
-            return "very_light"
-        elif brightness > 170:
-            return "light"
-        elif brightness > 140:
-            return "medium_light"
-        elif brightness > 110:
-            return "medium"
-        elif brightness > 80:
-            return "medium_dark"
-        elif brightness > 50:
-            return "dark"
-        else:
-            return "very_dark"
+        """Classify RGB color (or an (N, 3) array of colors) into skin tone categories"""
+        # Skin tone classification based on brightness: bucket i covers
+        # SKIN_TONE_THRESHOLDS[i-1] < brightness <= SKIN_TONE_THRESHOLDS[i]
+        brightness = np.asarray(rgb_color, dtype=np.float64) @ _BRIGHTNESS_WEIGHTS
+        labels = SKIN_TONE_LABELS[np.searchsorted(SKIN_TONE_THRESHOLDS, brightness)]
+        return str(labels) if labels.ndim == 0 else labels
     
     def extract_body_measurements(self, image_path: str) -> Dict[str, any]:
         """Extract body measurements and shape from full-body image"""
@@ -119,20 +248,22 @@ class PhotoProcessingService:
             if img is None:
                 return {"error": "Could not load image"}
             
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            results = self.pose.process(img_rgb)
+            # Pose runs on a downscaled copy; landmarks are normalised, so they
+            # are scaled back with the original size below
+            results = self.pose.process(self._rgb_for_landmarks(img))
             
             if not results.pose_landmarks:
                 return {"error": "No pose detected in image"}
             
             landmarks = results.pose_landmarks.landmark
-            h, w, _ = img_rgb.shape
+            h, w, _ = img.shape
             
             # Extract key body points
-            key_points = self._extract_key_points(landmarks, w, h)
+            kp = self._key_point_array(landmarks, w, h)
+            key_points = self._key_points_dict(kp)
             
             # Calculate body measurements
-            measurements = self._calculate_body_measurements(key_points)
+            measurements = self._measurements_from_array(kp)
             
             # Determine body type
             body_type = self._determine_body_type(measurements)
@@ -147,79 +278,55 @@ class PhotoProcessingService:
         except Exception as e:
             return {"error": str(e), "success": False}
     
+    def _key_point_array(self, landmarks, width: int, height: int) -> np.ndarray:
+        """(13, 2) pixel key points in KEY_POINT_NAMES order, NaN where not visible"""
+        # Read every landmark once, then gather the key-point rows in one step
+        lm = np.fromiter(
+            (v for landmark in landmarks for v in (landmark.x, landmark.y, landmark.visibility)),
+            dtype=np.float64, count=3 * len(landmarks)
+        ).reshape(-1, 3)
+        kp = np.full((len(KEY_POINT_NAMES), 2), np.nan)
+        rows = np.flatnonzero(KEY_POINT_INDICES < len(lm))
+        selected = lm[KEY_POINT_INDICES[rows]]
+        visible = selected[:, 2] > 0.5  # Only use visible landmarks
+        kp[rows[visible]] = np.trunc(selected[visible, :2] * (width, height))
+        return kp
+    
+    def _key_points_dict(self, kp: np.ndarray) -> Dict[str, Tuple[int, int]]:
+        """Visible key points of a key-point array by body part name"""
+        return {
+            part: (int(x), int(y))
+            for part, (x, y) in zip(KEY_POINT_NAMES, kp.tolist())
+            if not math.isnan(x)
+        }
+    
     def _extract_key_points(self, landmarks, width: int, height: int) -> Dict[str, Tuple[int, int]]:
         """Extract key body points from pose landmarks"""
-        key_points = {}
-        
-        # Map MediaPipe landmark indices to body parts
-        landmark_map = {
-            'nose': 0,
-            'left_shoulder': 11,
-            'right_shoulder': 12,
-            'left_elbow': 13,
-            'right_elbow': 14,
-            'left_wrist': 15,
-            'right_wrist': 16,
-            'left_hip': 23,
-            'right_hip': 24,
-            'left_knee': 25,
-            'right_knee': 26,
-            'left_ankle': 27,
-            'right_ankle': 28
-        }
-        
-        for part, idx in landmark_map.items():
-            if idx < len(landmarks):
-                landmark = landmarks[idx]
-                if landmark.visibility > 0.5:  # Only use visible landmarks
-                    x = int(landmark.x * width)
-                    y = int(landmark.y * height)
-                    key_points[part] = (x, y)
-        
-        return key_points
+        return self._key_points_dict(self._key_point_array(landmarks, width, height))
     
     def _calculate_body_measurements(self, key_points: Dict[str, Tuple[int, int]]) -> Dict[str, float]:
         """Calculate body measurements from key points"""
+        kp = np.full((len(KEY_POINT_NAMES), 2), np.nan)
+        for i, part in enumerate(KEY_POINT_NAMES):
+            if part in key_points:
+                kp[i] = key_points[part]
+        return self._measurements_from_array(kp)
+    
+    def _measurements_from_array(self, kp: np.ndarray) -> Dict[str, float]:
+        """Calculate body measurements from a (13, 2) key-point array"""
         measurements = {}
         
         try:
-            # Shoulder width
-            if 'left_shoulder' in key_points and 'right_shoulder' in key_points:
-                left_shoulder = key_points['left_shoulder']
-                right_shoulder = key_points['right_shoulder']
-                shoulder_width = math.sqrt((left_shoulder[0] - right_shoulder[0])**2 + 
-                                         (left_shoulder[1] - right_shoulder[1])**2)
-                measurements['shoulder_width'] = shoulder_width
+            shoulder_width, hip_width, waist_width, body_height = _measure_key_points(kp)
             
-            # Hip width
-            if 'left_hip' in key_points and 'right_hip' in key_points:
-                left_hip = key_points['left_hip']
-                right_hip = key_points['right_hip']
-                hip_width = math.sqrt((left_hip[0] - right_hip[0])**2 + 
-                                    (left_hip[1] - right_hip[1])**2)
-                measurements['hip_width'] = hip_width
-            
-            # Waist approximation (midpoint between shoulders and hips)
-            if ('left_shoulder' in key_points and 'right_shoulder' in key_points and
-                'left_hip' in key_points and 'right_hip' in key_points):
-                
-                # Calculate waist position
-                shoulder_mid_y = (key_points['left_shoulder'][1] + key_points['right_shoulder'][1]) / 2
-                hip_mid_y = (key_points['left_hip'][1] + key_points['right_hip'][1]) / 2
-                waist_y = shoulder_mid_y + (hip_mid_y - shoulder_mid_y) * 0.7
-                
-                # Estimate waist width (this is approximate)
-                waist_width = measurements.get('shoulder_width', 0) * 0.8
-                measurements['waist_width'] = waist_width
-            
-            # Body height
-            if 'nose' in key_points and ('left_ankle' in key_points or 'right_ankle' in key_points):
-                nose_y = key_points['nose'][1]
-                ankle_y = min(key_points.get('left_ankle', (0, float('inf')))[1],
-                            key_points.get('right_ankle', (0, float('inf')))[1])
-                if ankle_y != float('inf'):
-                    body_height = ankle_y - nose_y
-                    measurements['body_height'] = body_height
+            if not math.isnan(shoulder_width):
+                measurements['shoulder_width'] = float(shoulder_width)
+            if not math.isnan(hip_width):
+                measurements['hip_width'] = float(hip_width)
+            if not math.isnan(waist_width):
+                measurements['waist_width'] = float(waist_width)
+            if not math.isnan(body_height):
+                measurements['body_height'] = int(body_height)
             
         except Exception as e:
             measurements['error'] = str(e)
@@ -231,29 +338,11 @@ class PhotoProcessingService:
         if not measurements or len(measurements) < 3:
             return "unknown"
         
-        shoulder_width = measurements.get('shoulder_width', 0)
-        waist_width = measurements.get('waist_width', 0)
-        hip_width = measurements.get('hip_width', 0)
-        
-        if shoulder_width == 0 or hip_width == 0:
-            return "unknown"
-        
-        # Calculate ratios
-        shoulder_hip_ratio = shoulder_width / hip_width
-        waist_hip_ratio = waist_width / hip_width if hip_width > 0 else 0
-        waist_shoulder_ratio = waist_width / shoulder_width if shoulder_width > 0 else 0
-        
-        # Body type classification
-        if shoulder_hip_ratio > 1.05:
-            return "inverted_triangle"
-        elif shoulder_hip_ratio < 0.95:
-            return "pear"
-        elif waist_hip_ratio < 0.75 and waist_shoulder_ratio < 0.75:
-            return "hourglass"
-        elif waist_hip_ratio > 0.85:
-            return "apple"
-        else:
-            return "rectangle"
+        return BODY_TYPES[_classify_body_shape(
+            float(measurements.get('shoulder_width', 0)),
+            float(measurements.get('waist_width', 0)),
+            float(measurements.get('hip_width', 0))
+        )]
     
     def process_user_photos(self, profile_photo_path: str, body_photos_paths: List[str]) -> Dict[str, any]:
         """Process all user photos and extract features"""
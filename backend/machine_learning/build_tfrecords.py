@@ -0,0 +1,17 @@
+from data_pipeline import write_tfrecords
+
+# ====== CONFIG ======
+DATA_DIR = "train"
+SEED = 42
+# (image size, validation split) of each training script; the shards are only
+# used by a script whose settings match
+RECORD_SPECS = [
+    ((224, 224), 0.2),   # train_classifier.py, train_resnet50.py
+    ((128, 128), None),  # train_custom_ml.py
+]
+
+# ====== BUILD ======
+# Decode + resize every image once; training then reads raw uint8 shards
+for image_size, validation_split in RECORD_SPECS:
+    record_dir = write_tfrecords(DATA_DIR, image_size, validation_split=validation_split, seed=SEED)
+    print(f"Saved {image_size[0]}x{image_size[1]} TFRecord shards to {record_dir}")
@@ -0,0 +1,45 @@
+import os
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+from tensorflow.python.compiler.tensorrt import trt_convert as trt
+
+from model_input import input_scale
+
+# === CONFIG ===
+MODEL_PATH = "ML_Res/clothing_resnet50.keras"
+SAVED_MODEL_DIR = "ML_Res/clothing_resnet50_raw_savedmodel"
+TRT_MODEL_DIR = "ML_Res/trt_fp16_raw"
+IMG_SIZE = (224, 224)
+
+# === EXPORT SAVEDMODEL ===
+# A SavedModel serving signature runs without the Keras predict() machinery
+# and always takes raw 0–255 pixels: models trained on [0, 1] batches are
+# exported behind a Rescaling layer
+model = load_model(MODEL_PATH)
+scale = input_scale(model)
+if scale != 1.0:
+    inputs = tf.keras.Input(shape=(*IMG_SIZE, 3))
+    model = tf.keras.Model(inputs, model(tf.keras.layers.Rescaling(scale)(inputs)))
+model.export(SAVED_MODEL_DIR)
+print(f"Saved SavedModel to {SAVED_MODEL_DIR}")
+
+# === CONVERT WITH TF-TRT (FP16) ===
+try:
+    converter = trt.TrtGraphConverterV2(
+        input_saved_model_dir=SAVED_MODEL_DIR,
+        precision_mode=trt.TrtPrecisionMode.FP16
+    )
+except RuntimeError as e:
+    # CPU-only / non-TensorRT builds: predict.py serves the plain SavedModel
+    print(f"TensorRT conversion skipped: {e}")
+else:
+    converter.convert()
+
+    # Build the engines now for the single-image batch predict.py uses,
+    # so the first request doesn't pay for it
+    def input_fn():
+        yield (tf.zeros((1, *IMG_SIZE, 3), dtype=tf.float32),)
+
+    converter.build(input_fn=input_fn)
+    converter.save(TRT_MODEL_DIR)
+    print(f"Saved TensorRT FP16 model to {TRT_MODEL_DIR}")
@@ -1,6 +1,9 @@
 # data_pipeline.py
 import tensorflow as tf
 import pandas as pd
+import numpy as np
+import glob
+import json
 import os
 
 AUTOTUNE = tf.data.AUTOTUNE
@@ -10,15 +13,17 @@ def parse_csv_line(image_root):
         # image_path is a tf.string tensor like "img/Blouse/…"
         # Join root + image_path into one full filepath tensor:
         full_path = tf.strings.join([image_root, image_path], separator=os.sep)
-        # Read & decode
-        image = tf.io.read_file(full_path)
-        image = tf.image.decode_jpeg(image, channels=3)
-        image = tf.image.resize(image, [224, 224])
-        image = image / 255.0
+        image = load_resized(full_path) / 255.0
         return image, label
     return _fn
 
-def make_dataset(csv_path, image_root, batch_size=32, shuffle=False):
+def load_resized(full_path):
+    # Read & decode, resize to 224×224 (float32, 0–255)
+    image = tf.io.read_file(full_path)
+    image = tf.image.decode_jpeg(image, channels=3)
+    return tf.image.resize(image, [224, 224])
+
+def make_dataset(csv_path, image_root, batch_size=32, shuffle=False, cache=False):
     # Load the CSV with pandas
     df = pd.read_csv(csv_path)
     paths = df['image_path'].values.astype(str)
@@ -26,9 +31,192 @@ def make_dataset(csv_path, image_root, batch_size=32, shuffle=False):
 
     # Build TF dataset
     ds = tf.data.Dataset.from_tensor_slices((paths, labels))
-    if shuffle:
-        ds = ds.shuffle(buffer_size=len(paths))
-    # Map the parser, batch, prefetch
-    ds = ds.map(parse_csv_line(image_root), num_parallel_calls=AUTOTUNE)
+    parse = parse_csv_line(image_root)
+    if cache:
+        # Decode once, keep the images in memory and reshuffle every epoch
+        ds = ds.map(parse, num_parallel_calls=AUTOTUNE).cache()
+        if shuffle:
+            ds = ds.shuffle(buffer_size=len(paths))
+    else:
+        if shuffle:
+            ds = ds.shuffle(buffer_size=len(paths))
+        # Map the parser. With shuffle on, batch composition is random anyway,
+        # so let reads finish out of order instead of waiting on the slowest file
+        ds = ds.map(parse, num_parallel_calls=AUTOTUNE, deterministic=not shuffle)
+    # Batch, prefetch
     ds = ds.batch(batch_size).prefetch(AUTOTUNE)
     return ds
+
+# ── Folder-per-class image datasets ─────────────────────────────────
+
+def _prefetch(ds, device=None):
+    """Prefetch on the host, then (with a device) onto the device as the final step"""
+    ds = ds.prefetch(AUTOTUNE)
+    if device is not None:
+        # must stay the last transformation of the pipeline
+        ds = ds.apply(tf.data.experimental.prefetch_to_device(device, buffer_size=2))
+    return ds
+
+def _list_directory(data_dir, image_size, validation_split=None, seed=42):
+    """(train, val) datasets of decoded (uint8 image, one-hot label) pairs plus the class names"""
+    options = dict(image_size=image_size, batch_size=None, label_mode='categorical',
+                   interpolation='nearest', seed=seed)
+    if validation_split:
+        train_files, val_files = tf.keras.utils.image_dataset_from_directory(
+            data_dir, validation_split=validation_split, subset='both', **options
+        )
+    else:
+        train_files, val_files = tf.keras.utils.image_dataset_from_directory(data_dir, **options), None
+
+    class_names = train_files.class_names
+    train_labels = np.array([
+        class_names.index(os.path.basename(os.path.dirname(p))) for p in train_files.file_paths
+    ])
+
+    def _to_uint8(image, label):
+        # nearest resizing keeps the original pixel values, so this is lossless
+        return tf.cast(image, tf.uint8), label
+
+    train_images = train_files.map(_to_uint8, num_parallel_calls=AUTOTUNE)
+    val_images = val_files.map(_to_uint8, num_parallel_calls=AUTOTUNE) if val_files is not None else None
+    return train_images, val_images, class_names, train_labels
+
+# ── TFRecord shards ─────────────────────────────────────────────────
+# build_tfrecords.py decodes and resizes a folder-per-class directory once into
+# ~100 MB shards of raw uint8 pixels; make_directory_datasets then streams
+# those sequentially instead of decoding every JPEG again.
+
+RECORD_SHARD_BYTES = 100 * 1024 * 1024
+RECORD_META = "meta.json"
+
+def records_dir_for(data_dir, image_size):
+    """Where the shards for data_dir at image_size live, e.g. train_records_224x224"""
+    return f"{os.path.normpath(data_dir)}_records_{image_size[0]}x{image_size[1]}"
+
+def _write_shards(images, prefix, shard_bytes):
+    writer, shard, written = None, 0, 0
+    for image, label in images:
+        if writer is None or written >= shard_bytes:
+            if writer is not None:
+                writer.close()
+            writer = tf.io.TFRecordWriter(f"{prefix}-{shard:05d}.tfrecord")
+            shard, written = shard + 1, 0
+        example = tf.train.Example(features=tf.train.Features(feature={
+            'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.numpy().tobytes()])),
+            'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[int(np.argmax(label))])),
+        }))
+        record = example.SerializeToString()
+        writer.write(record)
+        written += len(record)
+    if writer is not None:
+        writer.close()
+
+def write_tfrecords(data_dir, image_size, validation_split=None, seed=42, shard_bytes=RECORD_SHARD_BYTES):
+    """Decode every image in data_dir once into train-/val- TFRecord shards; returns their directory"""
+    record_dir = records_dir_for(data_dir, image_size)
+    os.makedirs(record_dir, exist_ok=True)
+    # the metadata is written last, so a half-built directory is never read
+    for path in glob.glob(os.path.join(record_dir, "*.tfrecord")) + glob.glob(os.path.join(record_dir, RECORD_META)):
+        os.remove(path)
+
+    train_images, val_images, class_names, train_labels = _list_directory(
+        data_dir, image_size, validation_split, seed
+    )
+    _write_shards(train_images, os.path.join(record_dir, "train"), shard_bytes)
+    if val_images is not None:
+        _write_shards(val_images, os.path.join(record_dir, "val"), shard_bytes)
+
+    with open(os.path.join(record_dir, RECORD_META), "w") as f:
+        json.dump({
+            "class_names": class_names,
+            "image_size": list(image_size),
+            "validation_split": validation_split or None,
+            "seed": seed,
+            "train_labels": train_labels.tolist(),
+        }, f)
+    return record_dir
+
+def _read_shards(record_dir, split, image_size, num_classes):
+    shards = sorted(glob.glob(os.path.join(record_dir, f"{split}-*.tfrecord")))
+    features = {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.int64),
+    }
+
+    def _parse(record):
+        example = tf.io.parse_single_example(record, features)
+        image = tf.reshape(tf.io.decode_raw(example['image'], tf.uint8), [*image_size, 3])
+        return image, tf.one_hot(example['label'], num_classes)
+
+    return (tf.data.TFRecordDataset(shards, num_parallel_reads=AUTOTUNE)
+            .map(_parse, num_parallel_calls=AUTOTUNE))
+
+def _load_records(data_dir, image_size, validation_split=None, seed=42):
+    """Same as _list_directory, read from shards written with the same settings, else None"""
+    record_dir = records_dir_for(data_dir, image_size)
+    try:
+        with open(os.path.join(record_dir, RECORD_META)) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta["validation_split"] != (validation_split or None) or (validation_split and meta["seed"] != seed):
+        print(f"Ignoring {record_dir}: built with a different validation split")
+        return None
+
+    class_names = meta["class_names"]
+    train_images = _read_shards(record_dir, "train", image_size, len(class_names))
+    val_images = _read_shards(record_dir, "val", image_size, len(class_names)) if validation_split else None
+    return train_images, val_images, class_names, np.array(meta["train_labels"])
+
+def make_directory_datasets(data_dir, image_size, batch_size, augment=None, mix=None,
+                            validation_split=None, seed=42, device=None, scale=True):
+    """Batched (image, one-hot label) datasets from a folder-per-class directory.
+
+    Images are decoded once and cached as uint8, reshuffled every epoch and
+    scaled to [0, 1]; augment (images → images) and then mix ((images, labels)
+    → (images, labels), e.g. mixup) run on training batches only.
+    With scale=False batches stay uint8 (0–255) for models that rescale
+    inside the graph, a quarter of the bytes per host→device copy; augmented
+    batches are rounded back to uint8, and mix is rejected (ValueError).
+    When build_tfrecords.py has written shards for this directory, size and
+    split, they are read instead of the image files.
+    With a device (e.g. '/gpu:0') the next batches are copied there while the
+    current step runs.
+    Returns (train_ds, val_ds, class_names, train_labels); val_ds is None
+    without a validation_split.
+    """
+    if mix is not None and not scale:
+        # mixing blends images and labels in float; uint8 batches would truncate them
+        raise ValueError("mix requires scale=True")
+
+    loaded = _load_records(data_dir, image_size, validation_split, seed)
+    if loaded is None:
+        loaded = _list_directory(data_dir, image_size, validation_split, seed)
+    train_images, val_images, class_names, train_labels = loaded
+
+    def _scale(image, label):
+        return tf.cast(image, tf.float32) / 255.0, label
+
+    train_ds = (train_images.cache()
+                .shuffle(1024, seed=seed).batch(batch_size))
+    if scale:
+        train_ds = train_ds.map(_scale, num_parallel_calls=AUTOTUNE)
+    if augment is not None:
+        def _augment(image, label):
+            image = augment(image)
+            if not scale:
+                image = tf.saturate_cast(tf.round(image), tf.uint8)
+            return image, label
+        train_ds = train_ds.map(_augment, num_parallel_calls=AUTOTUNE)
+    if mix is not None:
+        train_ds = train_ds.map(mix, num_parallel_calls=AUTOTUNE)
+    train_ds = _prefetch(train_ds, device)
+
+    val_ds = None
+    if val_images is not None:
+        val_ds = val_images.cache().batch(batch_size)
+        if scale:
+            val_ds = val_ds.map(_scale, num_parallel_calls=AUTOTUNE)
+        val_ds = _prefetch(val_ds, device)
+
+    return train_ds, val_ds, class_names, train_labels
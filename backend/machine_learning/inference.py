@@ -1,90 +1,175 @@
 import os
+import re
 import json
 import joblib
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
+import tensorflow as tf
 from tensorflow.keras.models import load_model, Model
-from tensorflow.keras.preprocessing import image
 from tensorflow.keras.applications.resnet50 import ResNet50, preprocess_input
+import cv2
 import matplotlib.pyplot as plt
-from PIL import Image
+
+from model_input import input_scale
 
 # ── Config ──────────────────────────────────────────────────────────
 ML_READY = "ML_Ready"
 FEATURES_FN = "resnet50_features.joblib"
+FEATURES_F16_FN = "resnet50_features_f16.npy"  # all categories stacked in file_map order
+SCORE_BLOCK_ROWS = 8192  # float16 rows upcast per block when scoring
 FILE_MAP_FN = "file_map.json"
-KNN_TEMPLATE = "knn_{category}.joblib"
 CLASSIFIER_FN = "ML_Res/clothing_resnet50.keras"
 CLASS_NAMES_FN = "ML_Res/class_names.json"
 TOP_K = 5  # how many neighbors per category
 
 # ── Helper: Parse filename metadata robustly ─────────────────────────
+# expected format: color_gender_occasion_type_idx.ext
+METADATA_RE = re.compile(r"([^_]*)_([^_]*)_([^_]*)_")
+METADATA_FIELDS = ("color", "gender", "occasion")
+
 def parse_metadata(path):
-    fname = os.path.basename(path)
-    parts = fname.split("_")
-    # expected format: color_gender_occasion_type_idx.ext
-    if len(parts) < 4:
+    m = METADATA_RE.match(os.path.basename(path))
+    if m is None:
         return {"color": None, "gender": None, "occasion": None}
-    color = parts[0]
-    gender = parts[1]
-    occasion = parts[2]
+    color, gender, occasion = m.groups()
     return {"color": color, "gender": gender, "occasion": occasion}
 
+def metadata_table(paths):
+    """Fixed-width color/gender/occasion columns for paths ('' where the name doesn't parse)"""
+    rows = []
+    for p in paths:
+        m = METADATA_RE.match(os.path.basename(p))
+        rows.append(m.groups() if m else ("", "", ""))
+    cols = np.array(rows, dtype=str).reshape(-1, len(METADATA_FIELDS))
+    table = np.empty(len(rows), dtype=[(field, cols.dtype) for field in METADATA_FIELDS])
+    for i, field in enumerate(METADATA_FIELDS):
+        table[field] = cols[:, i]
+    return table
+
 # ── Load Classifier & Class Names ───────────────────────────────────
 classifier = load_model(CLASSIFIER_FN)
+CLASSIFIER_SCALE = input_scale(classifier)  # 1 unless it predates the in-graph rescale
 with open(CLASS_NAMES_FN, "r") as f:
     class_to_idx = json.load(f)               # e.g. {"Overcoat":0, ...}
-idx_to_class = {v: k for k, v in class_to_idx.items()}
+# index → class name as an array, so a prediction is a plain array lookup
+idx_to_class = np.empty(max(class_to_idx.values()) + 1, dtype=object)
+for name, idx in class_to_idx.items():
+    idx_to_class[idx] = name
 
 # ── Load Feature Extractor ──────────────────────────────────────────
+# preprocess_input and L2 normalisation are part of the graph, so the
+# extractor takes raw uint8 pixels and returns unit-length features
 base = ResNet50(weights="imagenet", include_top=False, pooling="avg")
-feature_extractor = Model(inputs=base.input, outputs=base.output)
+raw_input = tf.keras.Input(shape=(224, 224, 3), dtype="uint8")
+preprocessed = tf.keras.layers.Lambda(
+    lambda t: preprocess_input(tf.cast(t, tf.float32)), name="preprocess"
+)(raw_input)
+normalized = tf.keras.layers.Lambda(
+    lambda t: tf.math.l2_normalize(t, axis=-1), name="l2_normalize"
+)(base(preprocessed))
+feature_extractor = Model(inputs=raw_input, outputs=normalized)
 
 # ── Load Precomputed Data ───────────────────────────────────────────
-features = joblib.load(os.path.join(ML_READY, FEATURES_FN))  # dict: cat → ndarray
 with open(os.path.join(ML_READY, FILE_MAP_FN), "r") as f:
     file_map = json.load(f)                                 # dict: cat → [paths]
 
-# build metadata_map: category → list of metadata dicts
-metadata_map = {}
-for cat, paths in file_map.items():
-    metadata_map[cat] = [parse_metadata(p) for p in paths]
-
-# ── Lazy‑load KNN models ────────────────────────────────────────────
-_knn_cache = {}
-def get_knn(category):
-    if category not in _knn_cache:
-        path = os.path.join(ML_READY, KNN_TEMPLATE.format(category=category))
-        _knn_cache[category] = joblib.load(path)
-    return _knn_cache[category]
+# build metadata_map: category → structured array of per-index metadata
+metadata_map = {cat: metadata_table(paths) for cat, paths in file_map.items()}
+
+# ── Stack all category features for single-pass similarity search ──
+# Features are L2-normalised, so ranking by dot product matches the
+# euclidean KNN ranking the per-category models used to give.
+f16_path = os.path.join(ML_READY, FEATURES_F16_FN)
+if os.path.exists(f16_path):
+    # float16 sidecar written by train_knns.py, paged in on demand
+    categories = list(file_map.keys())
+    ALL_FEATS = np.load(f16_path, mmap_mode="r")
+    category_sizes = [len(file_map[cat]) for cat in categories]
+else:
+    features = joblib.load(os.path.join(ML_READY, FEATURES_FN))  # dict: cat → ndarray
+    categories = list(features.keys())
+    ALL_FEATS = np.ascontiguousarray(
+        np.vstack([features[cat] for cat in categories]), dtype=np.float32
+    )
+    category_sizes = [len(features[cat]) for cat in categories]
+    del features
+
+category_slices = {}
+_start = 0
+for cat, size in zip(categories, category_sizes):
+    category_slices[cat] = slice(_start, _start + size)
+    _start += size
+
+def score_rows(rows, query):
+    """Dot product of every row with query, upcasting float16 rows to float32 block by block"""
+    if rows.dtype == np.float32:
+        return rows @ query
+    scores = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+        block = np.asarray(rows[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+        scores[start:start + len(block)] = block @ query
+    return scores
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idxs = np.argpartition(-scores, k - 1)[:k]
+    return idxs[np.argsort(-scores[idxs])]
+
+# ── Load image ──────────────────────────────────────────────────────
+@tf.function(input_signature=[tf.TensorSpec([], tf.string)])
+def load_image(img_path):
+    """Read, decode and resize an image into a (1, 224, 224, 3) uint8 batch"""
+    raw = tf.io.read_file(img_path)
+    img = tf.io.decode_image(raw, channels=3, expand_animations=False)
+    # nearest matches the interpolation image.load_img used and keeps uint8
+    img = tf.image.resize(img, (224, 224), method="nearest")
+    return tf.expand_dims(img, 0)
+
+# ── Compiled model calls ────────────────────────────────────────────
+# Calling the models directly inside a fixed-signature tf.function skips
+# Model.predict's batching and callback machinery and never retraces.
+@tf.function(input_signature=[tf.TensorSpec([None, 224, 224, 3], tf.float32)])
+def classify_batch(x):
+    # x is raw 0–255 pixels
+    return classifier(x * CLASSIFIER_SCALE, training=False)
+
+@tf.function(input_signature=[tf.TensorSpec([None, 224, 224, 3], tf.uint8)])
+def extract_batch(x):
+    return feature_extractor(x, training=False)
+
+@tf.function(input_signature=[tf.TensorSpec([None, 224, 224, 3], tf.uint8)])
+def classify_and_extract_batch(x):
+    # Both heads share one decoded batch
+    probs = classifier(tf.cast(x, tf.float32) * CLASSIFIER_SCALE, training=False)
+    return probs, feature_extractor(x, training=False)
 
 # ── Predict category ────────────────────────────────────────────────
 def predict_category(img_path):
-    img = image.load_img(img_path, target_size=(224,224))
-    x = np.expand_dims(image.img_to_array(img), 0) / 255.0
-    probs = classifier.predict(x, verbose=0)[0]
-    idx = np.argmax(probs)
-    return idx_to_class[idx]
+    x = tf.cast(load_image(img_path), tf.float32)
+    probs = classify_batch(x)[0].numpy()
+    return idx_to_class[int(np.argmax(probs))]
 
 # ── Extract feature ─────────────────────────────────────────────────
 def extract_feature(img_path):
-    img = image.load_img(img_path, target_size=(224,224))
-    x = np.expand_dims(image.img_to_array(img), 0)
-    x = preprocess_input(x)
-    f = feature_extractor.predict(x, verbose=0).flatten()
-    return f / np.linalg.norm(f)
+    return extract_batch(load_image(img_path)).numpy()[0]
+
+# ── Category + feature from one decode ──────────────────────────────
+def analyze_query(img_path):
+    probs, feats = classify_and_extract_batch(load_image(img_path))
+    return idx_to_class[int(np.argmax(probs[0]))], feats.numpy()[0]
 
 
 def recommend_similar(img_path, top_k=5):
-    query_cat = predict_category(img_path)
-    query_feat = extract_feature(img_path)
+    query_cat, query_feat = analyze_query(img_path)
 
-    knn = get_knn(query_cat)
-    dists, idxs = knn.kneighbors([query_feat], n_neighbors=top_k + 1)
+    scores = score_rows(ALL_FEATS[category_slices[query_cat]], query_feat)
+    idxs = top_k_indices(scores, top_k + 1)
 
     # Exclude the image itself if it's in the dataset
     results = []
-    for i, idx in enumerate(idxs[0]):
+    for idx in idxs:
         candidate_path = file_map[query_cat][idx]
         if os.path.abspath(candidate_path) != os.path.abspath(img_path):
             results.append(candidate_path)
@@ -99,66 +184,72 @@ def recommend_similar(img_path, top_k=5):
 
 # ── Outfit Recommendation with metadata filtering ───────────────────
 def recommend_outfit(img_path, top_k=TOP_K):
-    query_cat = predict_category(img_path)
+    query_cat, query_feat = analyze_query(img_path)
     query_meta = parse_metadata(img_path)
-    query_feat = extract_feature(img_path)
+
+    # One matrix-vector product scores every item of every category
+    all_scores = score_rows(ALL_FEATS, query_feat)
 
     recs_all = {}
-    for cat, feat_matrix in features.items():
+    for cat in categories:
         if cat == query_cat:
             continue
-        knn = get_knn(cat)
-        dists, idxs = knn.kneighbors([query_feat], n_neighbors=top_k * 3)
+        scores = all_scores[category_slices[cat]]
+        idxs = top_k_indices(scores, top_k * 3)
 
-        candidates = [(idx, dist, metadata_map[cat][idx])
-                      for idx, dist in zip(idxs[0], dists[0])]
+        # prefer same occasion & gender when possible, keeping score order
+        if query_meta["occasion"] and query_meta["gender"]:
+            meta = metadata_map[cat][idxs]
+            match = ((meta["occasion"] == query_meta["occasion"])
+                     & (meta["gender"] == query_meta["gender"]))
+            idxs = np.concatenate([idxs[match], idxs[~match]])
+        chosen = idxs[:top_k]
 
-        # filter by same occasion & gender when possible
-        filtered = [c for c in candidates
-                    if query_meta["occasion"] and query_meta["gender"]
-                    and c[2]["occasion"] == query_meta["occasion"]
-                    and c[2]["gender"]   == query_meta["gender"]]
-
-        chosen = filtered[:top_k]
-        if len(chosen) < top_k:
-            used = {c[0] for c in chosen}
-            for c in candidates:
-                if c[0] not in used:
-                    chosen.append(c)
-                if len(chosen) == top_k:
-                    break
-
-        recs_all[cat] = [file_map[cat][c[0]] for c in chosen]
+        recs_all[cat] = [file_map[cat][idx] for idx in chosen]
 
     return {"query_category": query_cat, "recommendations": recs_all}
 
 # ── Display recommendations ─────────────────────────────────────────
+DISPLAY_TILE = 224  # side of each mosaic tile in pixels
+
+def load_tile(path):
+    """Image as an RGB DISPLAY_TILE×DISPLAY_TILE tile, or None if it can't be read"""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    img = cv2.resize(img, (DISPLAY_TILE, DISPLAY_TILE), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
 def display_recommendations(img_path, recommendation_dict):
-    query_arr = np.array(Image.open(img_path))
     categories = list(recommendation_dict.keys())
     n_rows = len(categories) + 1
     n_cols = len(recommendation_dict[categories[0]])
 
-    fig, axes = plt.subplots(n_rows, n_cols, figsize=(n_cols*3, n_rows*3))
-    fig.tight_layout(pad=2.0)
-
-    for col in range(n_cols):
-        ax = axes[0, col]
-        ax.imshow(query_arr)
-        ax.set_title(f"Query ({os.path.basename(img_path)})")
-        ax.axis("off")
-
-    for i, cat in enumerate(categories, start=1):
-        for j, rec_path in enumerate(recommendation_dict[cat]):
-            ax = axes[i, j]
-            try:
-                rec_arr = np.array(Image.open(rec_path))
-                ax.imshow(rec_arr)
-                ax.set_title(cat)
-            except Exception:
-                ax.text(0.5, 0.5, "Load error", ha='center')
-            ax.axis("off")
-
+    # Decode every image once and draw the grid as a single mosaic
+    blank = np.full((DISPLAY_TILE, DISPLAY_TILE, 3), 255, dtype=np.uint8)
+    query_tile = load_tile(img_path)
+    rows = [[query_tile] * n_cols]
+    titles = [[f"Query ({os.path.basename(img_path)})"] * n_cols]
+    for cat in categories:
+        paths = recommendation_dict[cat][:n_cols]
+        rows.append([load_tile(p) for p in paths] + [blank] * (n_cols - len(paths)))
+        titles.append([cat] * len(paths) + [""] * (n_cols - len(paths)))
+
+    mosaic = np.vstack([
+        np.hstack([blank if tile is None else tile for tile in row]) for row in rows
+    ])
+
+    plt.figure(figsize=(n_cols*3, n_rows*3))
+    plt.imshow(mosaic)
+    for i, row in enumerate(rows):
+        for j, tile in enumerate(row):
+            x, y = (j + 0.5) * DISPLAY_TILE, i * DISPLAY_TILE
+            if tile is None:
+                plt.text(x, y + DISPLAY_TILE / 2, "Load error", ha="center")
+            if titles[i][j]:
+                plt.text(x, y, titles[i][j], ha="center", va="bottom", fontsize=8)
+    plt.axis("off")
+    plt.tight_layout()
     plt.show()
 
 
@@ -177,8 +268,7 @@ if __name__ == "__main__":
 # import numpy as np
 # import joblib, json
 # from tensorflow.keras.models import load_model
-# from tensorflow.keras.preprocessing import image
-# from tensorflow.keras.applications.resnet50 import preprocess_input, ResNet50
+# # from tensorflow.keras.applications.resnet50 import preprocess_input, ResNet50
 # from tensorflow.keras.models import Model
 # from PIL import Image
 
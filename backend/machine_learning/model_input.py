@@ -0,0 +1,12 @@
+# model_input.py
+# Kept free of training-only dependencies so app/routes/classifier.py can import it too
+import tensorflow as tf
+
+def input_scale(model):
+    """Factor to apply to raw 0–255 pixels before calling model: 1 when it
+    starts with its own Rescaling layer (trained with scale=False), 1/255 for
+    older models trained on [0, 1] batches"""
+    layers = [l for l in model.layers if not isinstance(l, tf.keras.layers.InputLayer)]
+    if layers and isinstance(layers[0], tf.keras.layers.Rescaling):
+        return 1.0
+    return 1.0 / 255
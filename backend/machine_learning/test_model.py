@@ -3,9 +3,10 @@ import json
 import numpy as np
 from tensorflow.keras.models import load_model
 from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.resnet50 import preprocess_input
 from tensorflow.keras.applications.resnet50 import decode_predictions  # Optional
 
+from model_input import input_scale
+
 # === CONFIG ===
 MODEL_PATH = "ML_Res/clothing_resnet50.keras"
 CLASS_NAMES_PATH = "ML_Res/class_names.json"
@@ -25,8 +26,7 @@ idx_to_class = {v: k for k, v in class_indices.items()}
 # === LOAD & PREPROCESS IMAGE ===
 img = image.load_img(IMG_PATH, target_size=IMG_SIZE)
 x = image.img_to_array(img)
-x = np.expand_dims(x, axis=0)
-x = preprocess_input(x)
+x = np.expand_dims(x, axis=0) * input_scale(model)  # [0, 1] for models without their own Rescaling
 
 # === PREDICT ===
 pred = model.predict(x)
@@ -1,46 +1,81 @@
 import os
 import json
+import math
 import matplotlib.pyplot as plt
 from collections import Counter
 import numpy as np
 
+# Async CUDA allocator so allocations don't stall the host→device copies;
+# has to be set before TensorFlow initialises the GPU
+os.environ.setdefault('TF_GPU_ALLOCATOR', 'cuda_malloc_async')
+# Let cuDNN benchmark conv algorithms for the fixed 224×224 NHWC input once
+# (cached per shape), and allow tensor-core (TF32) math for float32 ops
+os.environ.setdefault('TF_CUDNN_USE_AUTOTUNE', '1')
+os.environ.setdefault('TF_ENABLE_CUBLAS_TENSOR_OP_MATH_FP32', '1')
+os.environ.setdefault('TF_ENABLE_CUDNN_TENSOR_OP_MATH_FP32', '1')
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import EfficientNetB0
-from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout, BatchNormalization
+from tensorflow.keras.layers import (GlobalAveragePooling2D, Dense, Dropout, BatchNormalization,
+                                     RandomRotation, RandomTranslation, RandomZoom, RandomFlip)
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau, LearningRateScheduler
+from tensorflow.keras import mixed_precision
+from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
+from tensorflow.keras.optimizers.schedules import CosineDecayRestarts
 from tensorflow.keras.regularizers import l2
 from tensorflow.keras.losses import CategoricalCrossentropy
 import tensorflow.keras.backend as K
 
+from data_pipeline import make_directory_datasets
+
 # Configure TensorFlow to suppress warnings and use CPU if CUDA fails
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 tf.config.experimental.set_memory_growth(tf.config.list_physical_devices('GPU')[0], True) if tf.config.list_physical_devices('GPU') else None
 
+# Mixed precision on GPU: convs/matmuls in 16-bit, variables stay float32.
+# bfloat16 on Ampere and newer (no loss scaling needed), float16 before that.
+if tf.config.list_physical_devices('GPU'):
+    gpu_details = tf.config.experimental.get_device_details(tf.config.list_physical_devices('GPU')[0])
+    mixed_precision.set_global_policy(
+        'mixed_bfloat16' if gpu_details.get('compute_capability', (0, 0)) >= (8, 0) else 'mixed_float16'
+    )
+
+def make_optimizer(**kwargs):
+    """Adam, wrapped for dynamic loss scaling when training in float16"""
+    optimizer = Adam(**kwargs)
+    if mixed_precision.global_policy().name == 'mixed_float16':
+        optimizer = mixed_precision.LossScaleOptimizer(optimizer)
+    return optimizer
+
 # Set random seeds for reproducibility
 tf.random.set_seed(42)
 np.random.seed(42)
 
+# Data-parallel training on every visible GPU (one replica on CPU or a single GPU)
+strategy = tf.distribute.MirroredStrategy()
+replicas = strategy.num_replicas_in_sync
+
 # Enhanced Config
 data_dir = "train"
 image_size = (224, 224)
-batch_size = 32
+batch_size = 32 * replicas  # 32 per replica
 initial_epochs = 25  # Increased base training
 fine_tune_epochs = 15  # Reduced fine-tuning to prevent overfitting
-learning_rate = 1e-4
+learning_rate = 1e-4 * replicas  # Scaled linearly with the global batch
+fine_tune_lr = 5e-6 * replicas
 fine_tune_at = 50  # Unfreeze more layers for EfficientNet
 label_smoothing = 0.1  # Add label smoothing
 mixup_alpha = 0.2  # Mixup augmentation
 
 # Enhanced Data augmentation with mixup
-def mixup_data(x, y, alpha=0.2):
-    """Mixup augmentation"""
+def mixup_data(x, y, alpha=mixup_alpha):
+    """Mixup augmentation, built from TF ops so it runs as a tf.data map over batches"""
     if alpha > 0:
-        lam = np.random.beta(alpha, alpha)
+        # lam ~ Beta(alpha, alpha), drawn per batch from two Gamma samples
+        g = tf.random.gamma([2], alpha)
+        lam = g[0] / (g[0] + g[1])
     else:
-        lam = 1
+        lam = 1.0
     
     batch_size = tf.shape(x)[0]
     index = tf.random.shuffle(tf.range(batch_size))
@@ -50,54 +85,38 @@ def mixup_data(x, y, alpha=0.2):
     
     return mixed_x, mixed_y
 
-# Enhanced data generators with stronger augmentation
-train_datagen = ImageDataGenerator(
-    rescale=1./255,
-    validation_split=0.2,
-    # More aggressive augmentation
-    rotation_range=40,
-    width_shift_range=0.3,
-    height_shift_range=0.3,
-    zoom_range=0.3,
-    horizontal_flip=True,
-    shear_range=0.3,
-    brightness_range=[0.7, 1.3],
-    channel_shift_range=30.0,
-    fill_mode='nearest'
-)
-
-val_datagen = ImageDataGenerator(
-    rescale=1./255,
-    validation_split=0.2
-)
-
-train_gen = train_datagen.flow_from_directory(
-    data_dir,
-    target_size=image_size,
-    batch_size=batch_size,
-    subset='training',
-    shuffle=True,
-    class_mode='categorical'
-)
-
-val_gen = val_datagen.flow_from_directory(
-    data_dir,
-    target_size=image_size,
-    batch_size=batch_size,
-    subset='validation',
-    shuffle=False,
-    class_mode='categorical'
+# Enhanced tf.data pipeline with stronger augmentation (runs on batches in the input pipeline)
+geometric_augment = tf.keras.Sequential([
+    RandomRotation(40 / 360, fill_mode='nearest'),
+    RandomTranslation(0.3, 0.3, fill_mode='nearest'),
+    RandomZoom(0.3, fill_mode='nearest'),
+    RandomFlip('horizontal'),
+])
+
+def augment(images):
+    images = geometric_augment(images, training=True)
+    n = tf.shape(images)[0]
+    # brightness_range=[0.7, 1.3] and channel_shift_range=30 (on the 0-255 scale)
+    images = images * tf.random.uniform([n, 1, 1, 1], 0.7, 1.3)
+    images = images + tf.random.uniform([n, 1, 1, 3], -30.0 / 255, 30.0 / 255)
+    return tf.clip_by_value(images, 0.0, 1.0)
+
+train_ds, val_ds, class_names, train_labels = make_directory_datasets(
+    data_dir, image_size, batch_size, augment=augment, mix=mixup_data, validation_split=0.2, seed=42,
+    # with several replicas Keras distributes (and prefetches) batches to each GPU itself
+    device='/gpu:0' if replicas == 1 and tf.config.list_physical_devices('GPU') else None
 )
+class_indices = {name: i for i, name in enumerate(class_names)}
+num_classes = len(class_names)
 
 # Enhanced class balance analysis
-counter = Counter(train_gen.classes)
+counter = Counter(train_labels.tolist())
 print("🔍 Class Distribution Analysis:")
-print(f"Total training samples: {len(train_gen.classes)}")
+print(f"Total training samples: {len(train_labels)}")
 print(f"Number of classes: {len(counter)}")
 
-class_names = list(train_gen.class_indices.keys())
-for i, (class_name, count) in enumerate(zip(class_names, counter.values())):
-    print(f"  {class_name}: {count} samples")
+for i, class_name in enumerate(class_names):
+    print(f"  {class_name}: {counter[i]} samples")
 
 # Calculate class weights
 max_count = float(max(counter.values()))
@@ -105,33 +124,36 @@ class_weights = {int(i): float(max_count / count) for i, count in counter.items(
 print(f"\n📊 Class weights: {class_weights}")
 
 # Enhanced model setup with EfficientNet and stronger regularization
-base_model = EfficientNetB0(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
-base_model.trainable = False  # Freeze base initially
-
-x = base_model.output
-x = GlobalAveragePooling2D()(x)
-x = BatchNormalization()(x)
-x = Dropout(0.6)(x)  # Increased dropout for base training
-x = Dense(512, activation='relu', kernel_regularizer=l2(0.0001))(x)
-x = BatchNormalization()(x)
-x = Dropout(0.5)(x)
-x = Dense(256, activation='relu', kernel_regularizer=l2(0.0001))(x)
-x = BatchNormalization()(x)
-x = Dropout(0.4)(x)
-output = Dense(train_gen.num_classes, activation='softmax')(x)
-
-model = Model(inputs=base_model.input, outputs=output)
-
-# Custom loss with label smoothing
-loss_fn = CategoricalCrossentropy(label_smoothing=label_smoothing)
-
-# Compile with gradient clipping
-optimizer = Adam(learning_rate=learning_rate, clipnorm=1.0)
-model.compile(
-    optimizer=optimizer,
-    loss=loss_fn,
-    metrics=['accuracy']
-)
+# (variables and optimizer state are mirrored on every replica)
+with strategy.scope():
+    base_model = EfficientNetB0(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
+    base_model.trainable = False  # Freeze base initially
+
+    x = base_model.output
+    x = GlobalAveragePooling2D()(x)
+    x = BatchNormalization()(x)
+    x = Dropout(0.6, name='head_dropout_1')(x)  # Increased dropout for base training
+    x = Dense(512, activation='relu', kernel_regularizer=l2(0.0001), name='head_dense_1')(x)
+    x = BatchNormalization()(x)
+    x = Dropout(0.5, name='head_dropout_2')(x)
+    x = Dense(256, activation='relu', kernel_regularizer=l2(0.0001), name='head_dense_2')(x)
+    x = BatchNormalization()(x)
+    x = Dropout(0.4, name='head_dropout_3')(x)
+    output = Dense(num_classes, activation='softmax', dtype='float32')(x)  # softmax in float32
+
+    model = Model(inputs=base_model.input, outputs=output)
+
+    # Custom loss with label smoothing
+    loss_fn = CategoricalCrossentropy(label_smoothing=label_smoothing)
+
+    # Compile with gradient clipping
+    optimizer = make_optimizer(learning_rate=learning_rate, clipnorm=1.0)
+    model.compile(
+        optimizer=optimizer,
+        loss=loss_fn,
+        metrics=['accuracy'],
+        jit_compile=True  # XLA-fuse the train step
+    )
 
 print(f"\n🏗️ Model Architecture:")
 print(f"Total parameters: {model.count_params():,}")
@@ -164,19 +186,14 @@ lr_scheduler = ReduceLROnPlateau(
     verbose=1
 )
 
-# Cyclical learning rate for fine-tuning
-def cyclical_lr(epoch, lr):
-    if epoch < initial_epochs:
-        return lr
-    else:
-        # Cyclical learning rate in fine-tuning
-        cycle_epoch = (epoch - initial_epochs) % 6
-        if cycle_epoch < 3:
-            return 5e-6 * (1 + cycle_epoch / 3)
-        else:
-            return 5e-6 * (2 - cycle_epoch / 3)
-
-cyclical_scheduler = LearningRateScheduler(cyclical_lr, verbose=1)
+# Cyclical learning rate for fine-tuning: cosine cycles of 3 epochs with warm
+# restarts, computed per step inside the optimizer rather than by a callback
+steps_per_epoch = math.ceil(len(train_labels) / batch_size)
+cyclical_lr = CosineDecayRestarts(
+    initial_learning_rate=fine_tune_lr,
+    first_decay_steps=steps_per_epoch * 3,
+    t_mul=1.0  # every cycle as long as the first
+)
 
 print("\n🚀 Starting Base Model Training...")
 print(f"Training for {initial_epochs} epochs with frozen base model")
@@ -184,9 +201,9 @@ print(f"Using EfficientNetB0 with label smoothing: {label_smoothing}")
 
 # Train base model
 history = model.fit(
-    train_gen,
+    train_ds,
     epochs=initial_epochs,
-    validation_data=val_gen,
+    validation_data=val_ds,
     class_weight=class_weights,
     callbacks=[checkpoint, early_stop, lr_scheduler],
     verbose=1
@@ -220,28 +237,24 @@ def gradual_unfreeze(model, base_model, stage):
 # Stage 1: Unfreeze top layers only
 gradual_unfreeze(model, base_model, 1)
 
-# Stronger regularization for fine-tuning
-x = base_model.output
-x = GlobalAveragePooling2D()(x)
-x = BatchNormalization()(x)
-x = Dropout(0.7)(x)  # Even higher dropout
-x = Dense(512, activation='relu', kernel_regularizer=l2(0.001))(x)  # Stronger L2
-x = BatchNormalization()(x)
-x = Dropout(0.6)(x)
-x = Dense(256, activation='relu', kernel_regularizer=l2(0.001))(x)
-x = BatchNormalization()(x)
-x = Dropout(0.5)(x)
-output = Dense(train_gen.num_classes, activation='softmax')(x)
-
-model = Model(inputs=base_model.input, outputs=output)
+# Stronger regularization for fine-tuning, set on the trained head in place
+# so its weights carry over from base training
+for name, rate in (('head_dropout_1', 0.7), ('head_dropout_2', 0.6), ('head_dropout_3', 0.5)):
+    model.get_layer(name).rate = rate  # Even higher dropout
+for name in ('head_dense_1', 'head_dense_2'):
+    dense = model.get_layer(name)
+    dense.kernel_regularizer = l2(0.001)  # Stronger L2
+    dense.kernel.regularizer = dense.kernel_regularizer
 
 # Compile with very low learning rate and stronger gradient clipping
-optimizer_finetune = Adam(learning_rate=5e-6, clipnorm=0.5)
-model.compile(
-    optimizer=optimizer_finetune,
-    loss=loss_fn,
-    metrics=['accuracy']
-)
+with strategy.scope():
+    optimizer_finetune = make_optimizer(learning_rate=cyclical_lr, clipnorm=0.5)
+    model.compile(
+        optimizer=optimizer_finetune,
+        loss=loss_fn,
+        metrics=['accuracy'],
+        jit_compile=True
+    )
 
 print(f"Trainable parameters: {sum([tf.keras.backend.count_params(w) for w in model.trainable_weights]):,}")
 
@@ -257,32 +270,34 @@ early_stop_finetune = EarlyStopping(
 
 # Fine-tune with cyclical learning rate
 history_fine = model.fit(
-    train_gen,
+    train_ds,
     epochs=fine_tune_epochs,
-    validation_data=val_gen,
+    validation_data=val_ds,
     class_weight=class_weights,
-    callbacks=[checkpoint, early_stop_finetune, cyclical_scheduler],
+    callbacks=[checkpoint, early_stop_finetune],
     verbose=1
 )
 
 # Save class indices and model info
 with open("ML/class_names.json", "w") as f:
-    json.dump(train_gen.class_indices, f)
+    json.dump(class_indices, f)
 
 # Save training configuration
 config = {
     'model_type': 'EfficientNetB0',
+    'dtype_policy': mixed_precision.global_policy().name,
     'image_size': image_size,
     'batch_size': batch_size,
     'initial_epochs': initial_epochs,
     'fine_tune_epochs': fine_tune_epochs,
     'initial_lr': float(learning_rate),
-    'fine_tune_lr': 5e-6,
+    'fine_tune_lr': fine_tune_lr,
+    'replicas': replicas,
     'fine_tune_at': fine_tune_at,
     'label_smoothing': label_smoothing,
     'mixup_alpha': mixup_alpha,
     'class_weights': {str(k): float(v) for k, v in class_weights.items()},
-    'num_classes': int(train_gen.num_classes)
+    'num_classes': num_classes
 }
 
 with open("ML/training_config.json", "w") as f:
@@ -2,12 +2,14 @@ import os
 import json
 import matplotlib.pyplot as plt
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import (Conv2D, MaxPooling2D, Flatten,
-                                     Dense, Dropout, BatchNormalization)
+from tensorflow.keras.layers import (Input, Rescaling, Conv2D, MaxPooling2D, Flatten,
+                                     Dense, Dropout, BatchNormalization,
+                                     RandomRotation, RandomTranslation, RandomZoom, RandomFlip)
 from tensorflow.keras.optimizers import Adam
 
+from data_pipeline import make_directory_datasets
+
 # === CONFIGURATION ===
 DATA_DIR = "train"  # path to your image folder
 IMG_SIZE = (128, 128)  # smaller size for CPU training
@@ -19,27 +21,25 @@ CLASS_NAMES_PATH = "Custom_ML/custom_cnn_classes.json"
 PLOT_PATH = "Custom_ML/training_plot.png"
 
 # === DATA PREPROCESSING ===
-datagen = ImageDataGenerator(
-    rescale=1./255,
-    rotation_range=15,
-    zoom_range=0.1,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    horizontal_flip=True,
-    fill_mode='nearest'
-)
+# Augmentation runs on whole batches inside the tf.data pipeline
+augment = Sequential([
+    RandomRotation(15 / 360, fill_mode='nearest'),
+    RandomZoom(0.1, fill_mode='nearest'),
+    RandomTranslation(0.1, 0.1, fill_mode='nearest'),
+    RandomFlip('horizontal'),
+])
 
-train_gen = datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='categorical',
-    shuffle=True
+train_ds, _, class_names, _ = make_directory_datasets(
+    DATA_DIR, IMG_SIZE, BATCH_SIZE,
+    augment=lambda images: augment(images, training=True),
+    scale=False  # uint8 batches; the model rescales them
 )
 
 # === MODEL DEFINITION ===
 model = Sequential([
-    Conv2D(32, (3, 3), activation='relu', input_shape=(*IMG_SIZE, 3)),
+    Input(shape=(*IMG_SIZE, 3)),
+    Rescaling(1. / 255),  # raw 0–255 pixels in
+    Conv2D(32, (3, 3), activation='relu'),
     BatchNormalization(),
     MaxPooling2D(2, 2),
 
@@ -54,18 +54,19 @@ model = Sequential([
     Flatten(),
     Dense(256, activation='relu'),
     Dropout(0.5),
-    Dense(train_gen.num_classes, activation='softmax')
+    Dense(len(class_names), activation='softmax')
 ])
 
 model.compile(
     optimizer=Adam(learning_rate=LEARNING_RATE),
     loss='categorical_crossentropy',
-    metrics=['accuracy']
+    metrics=['accuracy'],
+    jit_compile=True  # XLA-fuse the train step
 )
 
 # === TRAINING ===
 history = model.fit(
-    train_gen,
+    train_ds,
     epochs=EPOCHS,
     verbose=1
 )
@@ -75,7 +76,7 @@ os.makedirs(os.path.dirname(MODEL_SAVE_PATH), exist_ok=True)
 model.save(MODEL_SAVE_PATH)
 
 with open(CLASS_NAMES_PATH, "w") as f:
-    json.dump(train_gen.class_indices, f)
+    json.dump({name: i for i, name in enumerate(class_names)}, f)
 
 # === PLOT TRAINING CURVES ===
 plt.figure(figsize=(8, 4))
@@ -1,57 +1,173 @@
 import os
 import json
+import hashlib
+import functools
 import numpy as np
 import joblib
+import tensorflow as tf
 from tensorflow.keras.applications.resnet50 import ResNet50, preprocess_input
-from tensorflow.keras.preprocessing import image
 from tensorflow.keras.models import Model
 from sklearn.neighbors import NearestNeighbors
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    from nvidia.dali import pipeline_def, fn, types
+except ImportError:
+    pipeline_def = None
+
 # === Config ===
 data_dir = "train"
 ml_ready_dir = "ML_Ready"
 feature_model_name = "resnet50_features.joblib"
+feature_f16_name = "resnet50_features_f16.npy"
 file_map_name = "file_map.json"
+feature_cache_name = "features_v2.npy"            # normalized float32 features of every image seen
+feature_cache_keys_name = "features_v2_keys.json"  # row order of the feature cache
 knn_template = "knn_{category}.joblib"
+faiss_template = "faiss_{category}.index"
+hnsw_neighbors = 32  # graph degree of the FAISS HNSW indexes
+batch_size = 64  # images per feature-extraction forward pass
 
 # Create output directory
 os.makedirs(ml_ready_dir, exist_ok=True)
 
-# 1. Init ResNet50 feature extractor
-base = ResNet50(weights="imagenet", include_top=False, pooling="avg")
-feature_model = Model(base.input, base.output)
+# 1. ResNet50 feature extractor, only loaded when some image needs extracting
+@functools.lru_cache(maxsize=1)
+def get_feature_model():
+    base = ResNet50(weights="imagenet", include_top=False, pooling="avg")
+    return Model(base.input, base.output)
+
+def file_key(path):
+    """Identifies one version of an image file: its path, mtime and size"""
+    stat = os.stat(path)
+    return hashlib.blake2b(f"{path}|{stat.st_mtime_ns}|{stat.st_size}".encode(), digest_size=16).hexdigest()
+
+def load_feature_cache():
+    cache_path = os.path.join(ml_ready_dir, feature_cache_name)
+    keys_path = os.path.join(ml_ready_dir, feature_cache_keys_name)
+    if not (os.path.exists(cache_path) and os.path.exists(keys_path)):
+        return {}
+    with open(keys_path) as f:
+        keys = json.load(f)
+    feats = np.load(cache_path)
+    return dict(zip(keys, feats))
+
+def load_image(img_path):
+    """Decode and resize one image to 224×224 uint8, passing the path through"""
+    img = tf.io.decode_image(tf.io.read_file(img_path), channels=3, expand_animations=False)
+    # nearest keeps uint8 and matches the resizing inference.py applies to queries
+    return tf.image.resize(img, (224, 224), method="nearest"), img_path
+
+def preprocess_batch(imgs, paths):
+    return preprocess_input(tf.cast(imgs, tf.float32)), paths
+
+def image_batches(paths):
+    """Preprocessed (images, paths) batches, decoded in parallel; unreadable files are skipped"""
+    return (tf.data.Dataset.from_tensor_slices(paths)
+            .map(load_image, num_parallel_calls=tf.data.AUTOTUNE)
+            .ignore_errors(log_warning=True)
+            .batch(batch_size)
+            .map(preprocess_batch, num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE))
+
+def dali_batches(paths):
+    """(preprocessed images, paths) batches decoded by DALI, with nvJPEG on the GPU when one is visible"""
+    on_gpu = bool(tf.config.list_physical_devices("GPU"))
+
+    @pipeline_def(batch_size=batch_size, num_threads=os.cpu_count() or 4,
+                  device_id=0 if on_gpu else None)
+    def pipeline():
+        encoded, _ = fn.readers.file(files=paths, name="Reader", pad_last_batch=True)
+        imgs = fn.decoders.image(encoded, device="mixed" if on_gpu else "cpu", output_type=types.BGR)
+        imgs = fn.resize(imgs, resize_x=224, resize_y=224, interp_type=types.INTERP_NN)
+        # same as the caffe-style preprocess_input: BGR minus the ImageNet means
+        return fn.crop_mirror_normalize(imgs, dtype=types.FLOAT, output_layout="HWC",
+                                        mean=[103.939, 116.779, 123.68], std=[1.0, 1.0, 1.0])
 
-# 2. Walk directories & extract features
+    pipe = pipeline()
+    pipe.build()
+    for start in range(0, len(paths), batch_size):
+        imgs, = pipe.run()
+        # GPU batches are handed to TensorFlow in place via DLPack
+        x = tf.experimental.dlpack.from_dlpack(imgs.as_tensor().__dlpack__()) if on_gpu else imgs.as_array()
+        n = min(batch_size, len(paths) - start)  # the last batch is padded
+        yield x[:n], paths[start:start + n]
+
+def tf_batches(paths):
+    for imgs, batch_paths in image_batches(paths):
+        yield imgs, [p.decode() for p in batch_paths.numpy()]
+
+def extract_features(batches):
+    feats, files = [], []
+    for imgs, batch_paths in batches:
+        f = get_feature_model().predict_on_batch(imgs)
+        # one vectorized norm per batch; the clip keeps an all-zero feature finite
+        feats.append(f / np.linalg.norm(f, axis=1, keepdims=True).clip(min=1e-12))
+        files.extend(batch_paths)
+    return feats, files
+
+# 2. Walk directories & extract features of new or changed images
+feature_cache = load_feature_cache()
 features = {}
 file_map = {}
+seen = {}  # key → feature of every current image, written back as the new cache
 for category in os.listdir(data_dir):
     cat_path = os.path.join(data_dir, category)
     if not os.path.isdir(cat_path):
         continue
-    feats, files = [], []
     print(f"Processing category: {category}")
-    for fname in os.listdir(cat_path):
-        img_path = os.path.join(cat_path, fname)
-        try:
-            img = image.load_img(img_path, target_size=(224, 224))
-        except Exception as e:
-            print(f"Skipping {img_path}: {e}")
-            continue
-        x = image.img_to_array(img)
-        x = np.expand_dims(x, axis=0)
-        x = preprocess_input(x)
-        f = feature_model.predict(x, verbose=0).flatten()
-        f /= np.linalg.norm(f)
-        feats.append(f)
-        files.append(img_path)
-    features[category] = np.vstack(feats)
+    paths = [os.path.join(cat_path, fname) for fname in os.listdir(cat_path)]
+    keys = {p: file_key(p) for p in paths}
+    new_paths = [p for p in paths if keys[p] not in feature_cache]
+    extracted = {}
+    if new_paths:
+        print(f"Extracting features for {len(new_paths)} of {len(paths)} image(s)")
+        feats = None
+        if pipeline_def is not None:
+            try:
+                feats, files = extract_features(dali_batches(new_paths))
+            except RuntimeError as e:
+                # DALI stops at the first unreadable file; tf.data skips those instead
+                print(f"DALI decode failed for {category}, using tf.data: {str(e).splitlines()[0]}")
+        if feats is None:
+            feats, files = extract_features(tf_batches(new_paths))
+        if files:
+            extracted = dict(zip(files, np.vstack(feats)))
+    skipped = len(new_paths) - len(extracted)
+    if skipped:
+        print(f"Skipped {skipped} unreadable file(s) in {category}")
+    files = [p for p in paths if p in extracted or keys[p] in feature_cache]
+    if not files:
+        continue
+    features[category] = np.vstack([
+        extracted[p] if p in extracted else feature_cache[keys[p]] for p in files
+    ])
     file_map[category] = files
+    seen.update(zip((keys[p] for p in files), features[category]))
 
 # 3. Save compressed features and file map
+# Stored as float16: half the bytes to load and scan; readers upcast per query.
+# The KNNs below are still fitted on the float32 features.
 feature_path = os.path.join(ml_ready_dir, feature_model_name)
-joblib.dump(features, feature_path, compress=3)
+joblib.dump({c: f.astype(np.float16) for c, f in features.items()}, feature_path, compress=3)
 print(f"Saved features to {feature_path}")
 
+# float16 copy of all categories stacked in file_map order, memory-mapped by inference.py
+feature_f16_path = os.path.join(ml_ready_dir, feature_f16_name)
+np.save(feature_f16_path, np.vstack([features[c] for c in file_map]).astype(np.float16))
+print(f"Saved float16 features to {feature_f16_path}")
+
+# float32 cache of the features keyed by file version, so reruns only extract
+# images that were added or changed since
+np.save(os.path.join(ml_ready_dir, feature_cache_name), np.array(list(seen.values()), dtype=np.float32))
+with open(os.path.join(ml_ready_dir, feature_cache_keys_name), 'w') as f:
+    json.dump(list(seen), f)
+print(f"Saved feature cache for {len(seen)} image(s)")
+
 file_map_path = os.path.join(ml_ready_dir, file_map_name)
 with open(file_map_path, 'w') as f:
     json.dump(file_map, f)
@@ -60,10 +176,22 @@ print(f"Saved file map to {file_map_path}")
 # 4. Train and save a KNN per category
 for category, feats in features.items():
     print(f"Training KNN for {category} ({feats.shape[0]} samples)")
-    knn = NearestNeighbors(n_neighbors=5, metric="euclidean")
+    # on unit-length features cosine ranks exactly like euclidean distance
+    knn = NearestNeighbors(n_neighbors=5, metric="cosine")
     knn.fit(feats)
     knn_path = os.path.join(ml_ready_dir, knn_template.format(category=category))
     joblib.dump(knn, knn_path, compress=3)
     print(f"Saved KNN model to {knn_path}")
 
+# 5. With FAISS installed, also save an HNSW index per category (preferred by the backend)
+if faiss is not None:
+    for category, feats in features.items():
+        # inner product of unit vectors is cosine similarity: same ranking as L2, fewer FLOPs
+        index = faiss.IndexHNSWFlat(feats.shape[1], hnsw_neighbors, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 200
+        index.add(np.ascontiguousarray(feats, dtype=np.float32))
+        index_path = os.path.join(ml_ready_dir, faiss_template.format(category=category))
+        faiss.write_index(index, index_path)
+        print(f"Saved FAISS index to {index_path}")
+
 print("All features and KNN models are ready in ML_Ready directory.")
@@ -1,65 +1,95 @@
 import os
 import json
+# Async CUDA allocator so allocations don't stall the host→device copies;
+# has to be set before TensorFlow initialises the GPU
+os.environ.setdefault('TF_GPU_ALLOCATOR', 'cuda_malloc_async')
+# Let cuDNN benchmark conv algorithms for the fixed 224×224 NHWC input once
+# (cached per shape), and allow tensor-core (TF32) math for float32 ops
+os.environ.setdefault('TF_CUDNN_USE_AUTOTUNE', '1')
+os.environ.setdefault('TF_ENABLE_CUBLAS_TENSOR_OP_MATH_FP32', '1')
+os.environ.setdefault('TF_ENABLE_CUDNN_TENSOR_OP_MATH_FP32', '1')
+import tensorflow as tf
+from tensorflow.keras import mixed_precision
 from tensorflow.keras.applications import ResNet50
 from tensorflow.keras.models import Model
-from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from tensorflow.keras.layers import (GlobalAveragePooling2D, Dense, Dropout, Rescaling,
+                                     RandomRotation, RandomTranslation, RandomZoom, RandomFlip)
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import ModelCheckpoint, ReduceLROnPlateau
 
+from data_pipeline import make_directory_datasets
+
 # ====== CONFIG ======
 DATA_DIR = "train"  # Replace with your actual path
 IMG_SIZE = (224, 224)
-BATCH_SIZE = 32
+BATCH_SIZE = 32  # per replica
+LEARNING_RATE = 1e-4  # per replica
 EPOCHS = 42
 MODEL_SAVE_PATH = "ML_Res/clothing_resnet50.keras"
 CLASS_NAMES_PATH = "ML_Res/class_names.json"
 
-# ====== DATA AUGMENTATION ======
-datagen = ImageDataGenerator(
-    rescale=1. / 255,
-    validation_split=0.2,
-    rotation_range=25,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    shear_range=0.1,
-    zoom_range=0.2,
-    horizontal_flip=True,
-    fill_mode="nearest"
-)
+# ====== MIXED PRECISION ======
+# On GPU run convs/matmuls in 16-bit while variables stay float32:
+# bfloat16 on Ampere and newer, float16 (with loss scaling) before that
+if tf.config.list_physical_devices('GPU'):
+    gpu_details = tf.config.experimental.get_device_details(tf.config.list_physical_devices('GPU')[0])
+    mixed_precision.set_global_policy(
+        'mixed_bfloat16' if gpu_details.get('compute_capability', (0, 0)) >= (8, 0) else 'mixed_float16'
+    )
 
-train_gen = datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    subset='training',
-    shuffle=True
-)
+# ====== DISTRIBUTION ======
+# Data-parallel across every visible GPU; the global batch and the learning
+# rate grow linearly with the number of replicas
+strategy = tf.distribute.MirroredStrategy()
+global_batch_size = BATCH_SIZE * strategy.num_replicas_in_sync
+learning_rate = LEARNING_RATE * strategy.num_replicas_in_sync
 
-val_gen = datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    subset='validation',
-    shuffle=False
+# ====== DATA AUGMENTATION ======
+# Runs on whole batches inside the tf.data pipeline; validation is not augmented.
+# (Inside the model it would turn off XLA for the whole train step.)
+augment = tf.keras.Sequential([
+    RandomRotation(25 / 360, fill_mode="nearest"),
+    RandomTranslation(0.1, 0.1, fill_mode="nearest"),
+    RandomZoom(0.2, fill_mode="nearest"),
+    RandomFlip("horizontal"),
+])
+
+train_ds, val_ds, class_names, _ = make_directory_datasets(
+    DATA_DIR, IMG_SIZE, global_batch_size,
+    augment=lambda images: augment(images, training=True),
+    validation_split=0.2,
+    scale=False,  # uint8 batches; the model rescales on device
+    # with several replicas Keras distributes batches to each GPU itself
+    device="/gpu:0" if strategy.num_replicas_in_sync == 1 and tf.config.list_physical_devices("GPU") else None
 )
 
 # ====== MODEL ======
-base_model = ResNet50(weights='imagenet', include_top=False, input_shape=(IMG_SIZE[0], IMG_SIZE[1], 3))
-base_model.trainable = True  # Fine-tune all layers
+# Variables and optimizer state are mirrored on every replica
+with strategy.scope():
+    base_model = ResNet50(weights='imagenet', include_top=False, input_shape=(IMG_SIZE[0], IMG_SIZE[1], 3))
+    base_model.trainable = True  # Fine-tune all layers
 
-x = GlobalAveragePooling2D()(base_model.output)
-x = Dropout(0.4)(x)
-output = Dense(train_gen.num_classes, activation='softmax')(x)
+    # Takes raw 0–255 pixels: the ÷255 is fused into the graph instead of
+    # running per image on the CPU
+    inputs = tf.keras.Input(shape=(IMG_SIZE[0], IMG_SIZE[1], 3))
+    x = Rescaling(1. / 255)(inputs)
+    x = base_model(x)
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(0.4)(x)
+    output = Dense(len(class_names), activation='softmax', dtype='float32')(x)  # softmax in float32
 
-model = Model(inputs=base_model.input, outputs=output)
+    model = Model(inputs=inputs, outputs=output)
 
-# ====== COMPILE ======
-model.compile(
-    optimizer=Adam(learning_rate=1e-4),
-    loss='categorical_crossentropy',
-    metrics=['accuracy']
-)
+    # ====== COMPILE ======
+    optimizer = Adam(learning_rate=learning_rate)
+    if mixed_precision.global_policy().name == 'mixed_float16':
+        optimizer = mixed_precision.LossScaleOptimizer(optimizer)
+    model.compile(
+        optimizer=optimizer,
+        loss='categorical_crossentropy',
+        metrics=['accuracy'],
+        jit_compile=True  # XLA-fuse the train step
+    )
 
 # ====== CALLBACKS ======
 checkpoint = ModelCheckpoint(
@@ -80,12 +110,12 @@ lr_schedule = ReduceLROnPlateau(
 
 # ====== TRAIN ======
 history = model.fit(
-    train_gen,
-    validation_data=val_gen,
+    train_ds,
+    validation_data=val_ds,
     epochs=EPOCHS,
     callbacks=[checkpoint, lr_schedule]
 )
 
 # ====== SAVE CLASS LABELS ======
 with open(CLASS_NAMES_PATH, 'w') as f:
-    json.dump(train_gen.class_indices, f)
+    json.dump({name: i for i, name in enumerate(class_names)}, f)
@@ -1,9 +1,32 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import time
+import copy
 from dotenv import load_dotenv
 import os
 load_dotenv()
 
+# One pooled keep-alive session for every call instead of a new connection each time
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_maxsize=10))
+_SESSION.mount("https://", HTTPAdapter(pool_maxsize=10))
+REQUEST_TIMEOUT = (3, 5)  # (connect, read) seconds
+
+# Successful responses are reused for the same (api_key, city, units) for a while
+WEATHER_CACHE_TTL = 600  # seconds
+WEATHER_CACHE_SIZE = 256  # entries; expired and then oldest ones are dropped on insert
+_weather_cache = {}  # key -> (fetch time, data), oldest fetch first
+
+
+def _cache_weather(key, data):
+    now = time.monotonic()
+    _weather_cache.pop(key, None)
+    for stale in [k for k, (fetched, _) in _weather_cache.items() if now - fetched >= WEATHER_CACHE_TTL]:
+        del _weather_cache[stale]
+    while len(_weather_cache) >= WEATHER_CACHE_SIZE:
+        del _weather_cache[next(iter(_weather_cache))]
+    _weather_cache[key] = (now, data)
 
 
 def get_weather(api_key, city_name="kigali", units="metric"):
@@ -21,13 +44,19 @@ def get_weather(api_key, city_name="kigali", units="metric"):
         dict or None: A dictionary containing weather data if successful,
                       otherwise None.
     """
+    key = (api_key, city_name, units)
+    cached = _weather_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < WEATHER_CACHE_TTL:
+        return copy.deepcopy(cached[1])  # callers may modify what they get
+
     base_url = "http://api.openweathermap.org/data/2.5/weather?"
     complete_url = f"{base_url}q={city_name}&appid={api_key}&units={units}"
 
     try:
-        response = requests.get(complete_url)
+        response = _SESSION.get(complete_url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
         data = response.json()
+        _cache_weather(key, copy.deepcopy(data))
         return data
 
         # if data["cod"] == 200:  # Check if the city was found
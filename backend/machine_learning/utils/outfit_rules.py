@@ -1,19 +1,44 @@
 # utils/outfit_rules.py
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Final
 from .color_utils import get_temperature, get_tone, get_saturation
 
+# Lookup tables used by the scoring methods; module-level constants so they
+# are built once and have concrete types when compiled with mypyc
+FORMALITY_MAP: Final[Dict[str, float]] = {
+    "dress": 0.8, "suit": 0.9, "blazer": 0.7, "dress_shirt": 0.6,
+    "dress_pants": 0.6, "formal_shoes": 0.7, "tie": 0.8,
+    "jeans": 0.2, "t-shirt": 0.1, "sneakers": 0.1, "shorts": 0.1,
+    "hoodie": 0.1, "flip-flops": 0.0
+}
+COLD_APPROPRIATE: Final[Tuple[str, ...]] = ("coat", "jacket", "sweater", "boots", "long_pants")
+HOT_APPROPRIATE: Final[Tuple[str, ...]] = ("shorts", "t-shirt", "sandals", "light_dress", "tank_top")
+RAIN_APPROPRIATE: Final[Tuple[str, ...]] = ("waterproof", "jacket", "boots")
+
+
+def _category_lc(item: Dict) -> str:
+    """Lower-cased category, reusing the shadow field set when the wardrobe was loaded"""
+    category = item.get("_category_lc")
+    return category if category is not None else item.get("category", "").lower()
+
+
+def _color_lc(item: Dict) -> str:
+    """Lower-cased color name, reusing the shadow field set when the wardrobe was loaded"""
+    color = item.get("_color_lc")
+    return color if color is not None else item.get("color_name", "").lower()
+
+
 class OutfitRules:
     """Advanced outfit matching rules and style guidelines"""
     
-    def __init__(self):
-        self.season_colors = {
+    def __init__(self) -> None:
+        self.season_colors: Dict[str, List[str]] = {
             "spring": ["coral", "peach", "yellow", "light_green", "turquoise"],
             "summer": ["soft_blue", "pink", "lavender", "mint", "rose"],
             "autumn": ["orange", "rust", "brown", "olive", "burgundy"],
             "winter": ["black", "white", "navy", "red", "jewel_tones"]
         }
         
-        self.occasion_rules = {
+        self.occasion_rules: Dict[str, Dict[str, Any]] = {
             "formal": {
                 "required_categories": ["dress", "suit", "formal_shoes"],
                 "color_restrictions": ["black", "navy", "gray", "burgundy"],
@@ -46,7 +71,7 @@ class OutfitRules:
             }
         }
         
-        self.style_rules = {
+        self.style_rules: Dict[str, Dict[str, Any]] = {
             "minimalist": {
                 "color_palette": ["black", "white", "gray", "beige"],
                 "pattern_preference": "solid",
@@ -93,7 +118,7 @@ class OutfitRules:
             return {"valid": True, "score": 0.5, "notes": ["Unknown occasion"]}
         
         rules = self.occasion_rules[occasion]
-        validation_results = {
+        validation_results: Dict[str, Any] = {
             "valid": True,
             "score": 1.0,
             "notes": [],
@@ -102,7 +127,7 @@ class OutfitRules:
         
         # Check required categories
         if "required_categories" in rules:
-            outfit_categories = [item.get("category", "").lower() for item in outfit_items]
+            outfit_categories = [_category_lc(item) for item in outfit_items]
             missing_categories = []
             
             for required_cat in rules["required_categories"]:
@@ -115,7 +140,7 @@ class OutfitRules:
         
         # Check color restrictions
         if "color_restrictions" in rules:
-            outfit_colors = [item.get("color_name", "").lower() for item in outfit_items]
+            outfit_colors = [_color_lc(item) for item in outfit_items]
             restricted_colors = rules["color_restrictions"]
             
             non_compliant_colors = []
@@ -138,11 +163,11 @@ class OutfitRules:
             return 0.5
         
         style_rules = self.style_rules[target_style]
-        coherence_scores = []
+        coherence_scores: List[float] = []
         
         # Check color palette compatibility
         if "color_palette" in style_rules:
-            outfit_colors = [item.get("color_name", "").lower() for item in outfit_items]
+            outfit_colors = [_color_lc(item) for item in outfit_items]
             style_colors = style_rules["color_palette"]
             
             color_matches = sum(1 for color in outfit_colors 
@@ -159,19 +184,12 @@ class OutfitRules:
     
     def get_outfit_formality_score(self, outfit_items: List[Dict]) -> float:
         """Calculate the formality level of an outfit (0 = very casual, 1 = very formal)"""
-        formality_map = {
-            "dress": 0.8, "suit": 0.9, "blazer": 0.7, "dress_shirt": 0.6,
-            "dress_pants": 0.6, "formal_shoes": 0.7, "tie": 0.8,
-            "jeans": 0.2, "t-shirt": 0.1, "sneakers": 0.1, "shorts": 0.1,
-            "hoodie": 0.1, "flip-flops": 0.0
-        }
-        
-        total_formality = 0
+        total_formality = 0.0
         item_count = 0
         
         for item in outfit_items:
-            category = item.get("category", "").lower()
-            for formal_item, score in formality_map.items():
+            category = _category_lc(item)
+            for formal_item, score in FORMALITY_MAP.items():
                 if formal_item in category:
                     total_formality += score
                     item_count += 1
@@ -185,13 +203,13 @@ class OutfitRules:
     
     def suggest_missing_pieces(self, outfit_items: List[Dict], occasion: str) -> List[str]:
         """Suggest missing pieces to complete an outfit"""
-        suggestions = []
+        suggestions: List[str] = []
         
         if occasion not in self.occasion_rules:
             return suggestions
         
         rules = self.occasion_rules[occasion]
-        current_categories = [item.get("category", "").lower() for item in outfit_items]
+        current_categories = [_category_lc(item) for item in outfit_items]
         
         # Check for missing required categories
         if "required_categories" in rules:
@@ -213,21 +231,19 @@ class OutfitRules:
     def calculate_weather_appropriateness(self, outfit_items: List[Dict], 
                                         weather_condition: str, temperature: float) -> float:
         """Calculate how appropriate the outfit is for given weather conditions"""
-        weather_scores = []
+        weather_scores: List[float] = []
         
         # Temperature appropriateness
         if temperature < 10:  # Cold
-            cold_appropriate = ["coat", "jacket", "sweater", "boots", "long_pants"]
             cold_score = sum(1 for item in outfit_items 
-                           if any(cold_item in item.get("category", "").lower() 
-                                 for cold_item in cold_appropriate))
+                           if any(cold_item in _category_lc(item) 
+                                 for cold_item in COLD_APPROPRIATE))
             weather_scores.append(min(cold_score / 2, 1.0))  # Need at least 2 warm items
         
         elif temperature > 25:  # Hot
-            hot_appropriate = ["shorts", "t-shirt", "sandals", "light_dress", "tank_top"]
             hot_score = sum(1 for item in outfit_items 
-                          if any(hot_item in item.get("category", "").lower() 
-                                for hot_item in hot_appropriate))
+                          if any(hot_item in _category_lc(item) 
+                                for hot_item in HOT_APPROPRIATE))
             weather_scores.append(min(hot_score / 2, 1.0))
         
         else:  # Moderate temperature
@@ -235,10 +251,9 @@ class OutfitRules:
         
         # Weather condition appropriateness
         if "rain" in weather_condition.lower():
-            rain_appropriate = ["waterproof", "jacket", "boots"]
             rain_score = sum(1 for item in outfit_items 
-                           if any(rain_item in item.get("category", "").lower() 
-                                 for rain_item in rain_appropriate))
+                           if any(rain_item in _category_lc(item) 
+                                 for rain_item in RAIN_APPROPRIATE))
             weather_scores.append(min(rain_score, 1.0))
         
         return sum(weather_scores) / len(weather_scores) if weather_scores else 0.7
\ No newline at end of file
@@ -1,24 +1,106 @@
 # utils/recommender.py
 import json
+import os
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from .color_utils import colors_match, get_color_harmony, get_temperature, get_tone
 import random
+import itertools
+import functools
+from collections import Counter, defaultdict
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+
+def _cosine_numpy(A: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row of A against b (zero vectors score 0)"""
+    denom = np.sqrt(np.einsum('ij,ij->i', A, A) * np.einsum('j,j->', b, b))
+    dots = np.einsum('ij,j->i', A, b)
+    return np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+
+
+def _cosine_loop(A, b):
+    """Cosine similarity of every row of A against b in a single fused pass"""
+    n, d = A.shape
+    out = np.zeros(n, dtype=np.float64)
+    b_norm = 0.0
+    for k in range(d):
+        b_norm += b[k] * b[k]
+    b_norm = np.sqrt(b_norm)
+    for i in range(n):
+        dot = 0.0
+        a_norm = 0.0
+        for k in range(d):
+            dot += A[i, k] * b[k]
+            a_norm += A[i, k] * A[i, k]
+        denom = np.sqrt(a_norm) * b_norm
+        if denom > 0.0:
+            out[i] = dot / denom
+    return out
+
+
+# Use the Numba kernel when available, otherwise fall back to vectorized NumPy
+_cosine = njit(cache=True, fastmath=True)(_cosine_loop) if njit is not None else _cosine_numpy
+
+# Score contributed by each pairwise color harmony in _calculate_outfit_score
+_HARMONY_SCORES = {
+    'Complementary': 1.0,
+    'Analogous': 0.9,
+    'Triadic': 0.8,
+    'Split-Complementary': 0.7
+}
 
 class OutfitRecommender:
     def __init__(self, wardrobe_db_path: str):
         self.wardrobe_db_path = wardrobe_db_path
-        self.scaler = StandardScaler()
+        self._decoded_source = None
+        self._feature_matrix = np.empty((0, 0), dtype=np.float32)
+        self._feature_widths = np.empty(0, dtype=np.int64)
+        self._wardrobe: List[Dict] = []
+        self._wardrobe_mtime = None
+        self._by_occasion: Dict[str, List[Dict]] = {}
+        self._by_category_by_occasion: Dict[str, Dict[str, List[Dict]]] = {}
+        self._pair_masks: Dict[Tuple[int, int], Tuple[List[Dict], List[Dict], np.ndarray]] = {}
         
     def load_wardrobe(self) -> List[Dict]:
-        """Load wardrobe data from JSON file"""
+        """Load wardrobe data from JSON file, reusing the parsed data while the file is unchanged"""
         try:
-            with open(self.wardrobe_db_path, 'r') as f:
-                return json.load(f)
+            mtime = os.path.getmtime(self.wardrobe_db_path)
+            if mtime == self._wardrobe_mtime:
+                return self._wardrobe
+            with open(self.wardrobe_db_path, 'rb') as f:
+                data = _json_loads(f.read())
         except FileNotFoundError:
-            return []
+            mtime = None
+            data = []
+
+        # Lower-case the string fields once instead of on every rule check,
+        # and index items by occasion and category for recommend_outfits
+        by_occasion = defaultdict(list)
+        for item in data:
+            item['_category_lc'] = item.get('category', '').lower()
+            item['_occasion_lc'] = item.get('occasion', '').lower()
+            item['_color_lc'] = item.get('color_name', '').lower()
+            by_occasion[item['_occasion_lc']].append(item)
+
+        self._by_occasion = dict(by_occasion)
+        self._by_category_by_occasion = {
+            occasion: self._group_by_category(items)
+            for occasion, items in self._by_occasion.items()
+        }
+        self._pair_masks = {}
+        self._wardrobe = data
+        self._wardrobe_mtime = mtime
+        return data
     
     def extract_features(self, item: Dict) -> np.ndarray:
         """Extract numerical features from wardrobe item"""
@@ -52,7 +134,7 @@ class OutfitRecommender:
         features.append(self._encode_temperature(item.get('temperature', '')))
         features.append(self._encode_tone(item.get('tone', '')))
         
-        return np.array(features)
+        return np.asarray(features, dtype=np.float32)
     
     def _encode_category(self, category: str) -> float:
         """Encode category as numerical value"""
@@ -86,6 +168,59 @@ class OutfitRecommender:
         """Encode color tone as numerical value"""
         tone_map = {'dark': 1.0, 'medium': 2.0, 'light': 3.0}
         return tone_map.get(tone.lower(), 0.0)
+
+    @property
+    def sidecar_path(self) -> str:
+        """Path of the .npz feature cache kept next to the wardrobe JSON"""
+        return os.path.splitext(self.wardrobe_db_path)[0] + '.npz'
+
+    def _load_sidecar(self, n_items: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Load cached features if the sidecar is newer than the wardrobe JSON"""
+        if self._wardrobe_mtime is None:
+            return None
+        try:
+            if os.path.getmtime(self.sidecar_path) < self._wardrobe_mtime:
+                return None
+            with np.load(self.sidecar_path) as sidecar:
+                matrix = sidecar['features'].astype(np.float32, copy=False)
+                widths = sidecar['widths']
+        except (OSError, KeyError, ValueError):
+            return None
+        if len(matrix) != n_items:
+            return None
+        return matrix, widths
+
+    def _save_sidecar(self, matrix: np.ndarray, widths: np.ndarray) -> None:
+        """Write the feature cache next to the wardrobe JSON (best effort)"""
+        tmp_path = self.sidecar_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, features=matrix, widths=widths)
+            os.replace(tmp_path, self.sidecar_path)
+        except OSError:
+            pass
+
+    def _decode_wardrobe(self, wardrobe: List[Dict]) -> None:
+        """Decode wardrobe items into a zero-padded feature matrix once per load"""
+        if wardrobe is self._decoded_source:
+            return
+
+        cached = self._load_sidecar(len(wardrobe)) if wardrobe is self._wardrobe else None
+        if cached is not None:
+            matrix, widths = cached
+        else:
+            vectors = [self.extract_features(item) for item in wardrobe]
+            width = max((len(v) for v in vectors), default=0)
+            matrix = np.zeros((len(vectors), width), dtype=np.float32)
+            for i, vector in enumerate(vectors):
+                matrix[i, :len(vector)] = vector
+            widths = np.array([len(v) for v in vectors], dtype=np.int64)
+            if wardrobe is self._wardrobe and self._wardrobe_mtime is not None:
+                self._save_sidecar(matrix, widths)
+
+        self._feature_matrix = matrix
+        self._feature_widths = widths
+        self._decoded_source = wardrobe
     
     def recommend_outfits(self, occasion: str = "casual", limit: int = 5) -> List[Dict]:
         """Recommend complete outfits for a given occasion"""
@@ -94,16 +229,12 @@ class OutfitRecommender:
         if not wardrobe:
             return []
         
-        # Filter by occasion
-        filtered_items = [item for item in wardrobe 
-                         if item.get('occasion', '').lower() == occasion.lower()]
+        # Items for the occasion, already grouped by category at load time
+        grouped_items = self._by_category_by_occasion.get(occasion.lower())
         
-        if not filtered_items:
+        if not grouped_items:
             return []
         
-        # Group items by category
-        grouped_items = self._group_by_category(filtered_items)
-        
         # Generate outfit combinations
         outfits = self._generate_outfit_combinations(grouped_items, limit)
         
@@ -113,7 +244,8 @@ class OutfitRecommender:
         """Group items by category"""
         groups = {}
         for item in items:
-            category = item.get('category', '').lower()
+            # Items that did not come through load_wardrobe lack the shadow field
+            category = item.get('_category_lc') or item.get('category', '').lower()
             if category not in groups:
                 groups[category] = []
             groups[category].append(item)
@@ -151,52 +283,73 @@ class OutfitRecommender:
                                      grouped_items: Dict[str, List[Dict]], 
                                      limit: int) -> List[Dict]:
         """Get combinations for a specific template"""
+        if not all(category in grouped_items for category in template):
+            return []
+
+        groups = [grouped_items[category] for category in template]
+        masks = {
+            (a, b): self._pair_compatibility(groups[a], groups[b])
+            for a, b in itertools.combinations(range(len(template)), 2)
+        }
+        max_candidates = 1000
+
+        # Extend partial outfits one slot at a time, keeping only index tuples
+        # whose items are pairwise color compatible
+        candidates = [(i,) for i in range(len(groups[0]))]
+        for slot in range(1, len(template)):
+            if len(candidates) > max_candidates:
+                candidates = random.sample(candidates, max_candidates)
+            # Apply the most selective mask first so rejected prefixes exit early
+            previous = sorted(range(slot), key=lambda prev: masks[(prev, slot)].mean())
+            extended = []
+            for prefix in candidates:
+                allowed = masks[(previous[0], slot)][prefix[previous[0]]]
+                for prev in previous[1:]:
+                    if not allowed.any():
+                        break
+                    allowed = allowed & masks[(prev, slot)][prefix[prev]]
+                extended.extend(prefix + (int(j),) for j in np.flatnonzero(allowed))
+            candidates = extended
+
+        # Pick distinct valid outfits at random
         combinations = []
-        attempts = 0
-        max_attempts = 100
-        
-        while len(combinations) < limit and attempts < max_attempts:
-            attempts += 1
-            
-            # Select random items for each category
-            outfit_items = []
-            for category in template:
-                if category in grouped_items:
-                    item = random.choice(grouped_items[category])
-                    outfit_items.append(item)
-            
-            if len(outfit_items) == len(template):
-                # Check color compatibility
-                if self._check_color_compatibility(outfit_items):
-                    outfit_score = self._calculate_outfit_score(outfit_items)
-                    combinations.append({
-                        'items': outfit_items,
-                        'score': outfit_score,
-                        'template': template,
-                        'color_harmony': self._analyze_outfit_harmony(outfit_items)
-                    })
+        for combo in random.sample(candidates, min(limit, len(candidates))):
+            outfit_items = [groups[slot][index] for slot, index in enumerate(combo)]
+            harmonies = self._pair_harmonies(outfit_items)
+            combinations.append({
+                'items': outfit_items,
+                'score': self._calculate_outfit_score(outfit_items, harmonies),
+                'template': template,
+                'color_harmony': self._analyze_outfit_harmony(outfit_items, harmonies)
+            })
         
         # Sort by score and return
         combinations.sort(key=lambda x: x['score'], reverse=True)
         return combinations
     
-    def _check_color_compatibility(self, items: List[Dict]) -> bool:
-        """Check if colors in the outfit are compatible"""
-        if len(items) < 2:
-            return True
-        
-        # Check pairwise compatibility
-        for i in range(len(items)):
-            for j in range(i + 1, len(items)):
-                item1_features = items[i].get('features', [0, 0, 0])
-                item2_features = items[j].get('features', [0, 0, 0])
-                
-                if not colors_match(item1_features, item2_features):
-                    return False
-        
-        return True
-    
-    def _calculate_outfit_score(self, items: List[Dict]) -> float:
+    def _pair_compatibility(self, items_a: List[Dict], items_b: List[Dict]) -> np.ndarray:
+        """Boolean colors_match matrix between two category groups, cached per wardrobe load"""
+        key = (id(items_a), id(items_b))
+        cached = self._pair_masks.get(key)
+        if cached is not None and cached[0] is items_a and cached[1] is items_b:
+            return cached[2]
+
+        mask = np.array([
+            [colors_match(a.get('features', [0, 0, 0]), b.get('features', [0, 0, 0])) for b in items_b]
+            for a in items_a
+        ], dtype=bool).reshape(len(items_a), len(items_b))
+        # Keep the lists alive alongside the mask so their ids cannot be reused
+        self._pair_masks[key] = (items_a, items_b, mask)
+        return mask
+
+    def _pair_harmonies(self, items: List[Dict]) -> List[str]:
+        """Color harmony of every item pair in the outfit"""
+        return [
+            get_color_harmony(a.get('features', [0, 0, 0]), b.get('features', [0, 0, 0]))
+            for a, b in itertools.combinations(items, 2)
+        ]
+
+    def _calculate_outfit_score(self, items: List[Dict], harmonies: Optional[List[str]] = None) -> float:
         """Calculate compatibility score for an outfit"""
         if not items:
             return 0.0
@@ -205,23 +358,9 @@ class OutfitRecommender:
         
         # Color harmony score
         if len(items) >= 2:
-            color_scores = []
-            for i in range(len(items)):
-                for j in range(i + 1, len(items)):
-                    item1_features = items[i].get('features', [0, 0, 0])
-                    item2_features = items[j].get('features', [0, 0, 0])
-                    
-                    harmony = get_color_harmony(item1_features, item2_features)
-                    harmony_score = {
-                        'Complementary': 1.0,
-                        'Analogous': 0.9,
-                        'Triadic': 0.8,
-                        'Split-Complementary': 0.7
-                    }.get(harmony, 0.5)
-                    
-                    color_scores.append(harmony_score)
-            
-            scores.append(np.mean(color_scores))
+            if harmonies is None:
+                harmonies = self._pair_harmonies(items)
+            scores.append(np.mean([_HARMONY_SCORES.get(harmony, 0.5) for harmony in harmonies]))
         
         # Temperature consistency score
         temperatures = [item.get('temperature', 'Neutral') for item in items]
@@ -235,26 +374,17 @@ class OutfitRecommender:
         
         return np.mean(scores)
     
-    def _analyze_outfit_harmony(self, items: List[Dict]) -> Dict[str, Any]:
+    def _analyze_outfit_harmony(self, items: List[Dict], harmonies: Optional[List[str]] = None) -> Dict[str, Any]:
         """Analyze color harmony of the outfit"""
         if len(items) < 2:
             return {'type': 'Single Item', 'compatibility': 1.0}
         
-        harmonies = []
-        for i in range(len(items)):
-            for j in range(i + 1, len(items)):
-                item1_features = items[i].get('features', [0, 0, 0])
-                item2_features = items[j].get('features', [0, 0, 0])
-                harmony = get_color_harmony(item1_features, item2_features)
-                harmonies.append(harmony)
+        if harmonies is None:
+            harmonies = self._pair_harmonies(items)
         
         # Find most common harmony type
-        harmony_counts = {}
-        for harmony in harmonies:
-            harmony_counts[harmony] = harmony_counts.get(harmony, 0) + 1
-        
-        dominant_harmony = max(harmony_counts, key=harmony_counts.get)
-        compatibility = harmony_counts[dominant_harmony] / len(harmonies)
+        dominant_harmony, count = Counter(harmonies).most_common(1)[0]
+        compatibility = count / len(harmonies)
         
         return {
             'type': dominant_harmony,
@@ -270,28 +400,42 @@ class OutfitRecommender:
             return []
         
         # Extract features for all items
+        self._decode_wardrobe(wardrobe)
         target_features = self.extract_features(target_item)
-        item_features = [self.extract_features(item) for item in wardrobe]
-        
-        # Calculate similarities
+        width = len(target_features)
+
+        # Only items with the same feature layout as the target are comparable
+        candidates = np.flatnonzero(self._feature_widths == width)
+        if width == 0 or len(candidates) == 0:
+            return []
+
+        scores = _cosine(np.ascontiguousarray(self._feature_matrix[candidates, :width]), target_features)
+
+        # Calculate similarities, excluding the target item itself (the same
+        # wardrobe entry, or the entry with its id)
+        target_id = target_item.get('id')
         similarities = []
-        for i, item in enumerate(wardrobe):
-            if item != target_item:  # Exclude the target item itself
-                try:
-                    similarity = cosine_similarity([target_features], [item_features[i]])[0][0]
-                    similarities.append((item, similarity))
-                except:
-                    continue
+        for i, similarity in zip(candidates, scores):
+            item = wardrobe[i]
+            if item is target_item or (target_id is not None and item.get('id') == target_id):
+                continue
+            similarities.append((item, float(similarity)))
         
         # Sort by similarity and return top items
         similarities.sort(key=lambda x: x[1], reverse=True)
         return [item for item, _ in similarities[:limit]]
 
+@functools.lru_cache(maxsize=16)
+def get_recommender(wardrobe_db_path: str) -> OutfitRecommender:
+    """Shared recommender per wardrobe file, so its parsed wardrobe and
+    feature caches survive between calls"""
+    return OutfitRecommender(wardrobe_db_path)
+
 # Factory function for easy use
 def recommend_outfits(occasion: str = "casual", wardrobe_db_path: str = "database/wardrobe.json", 
                      limit: int = 5) -> List[Dict]:
     """Convenience function to get outfit recommendations"""
-    recommender = OutfitRecommender(wardrobe_db_path)
+    recommender = get_recommender(wardrobe_db_path)
     return recommender.recommend_outfits(occasion, limit)
 
 def map_weather_to_occasion_and_needs(weather: Dict) -> Tuple[str, List[str]]:
@@ -322,13 +466,14 @@ def map_weather_to_occasion_and_needs(weather: Dict) -> Tuple[str, List[str]]:
 
 def recommend_for_weather(weather_data: Dict, wardrobe_db_path: str = "database/wardrobe.json", limit: int = 5) -> List[Dict]:
     occasion, needed_categories = map_weather_to_occasion_and_needs(weather_data)
-    recommender = OutfitRecommender(wardrobe_db_path)
+    recommender = get_recommender(wardrobe_db_path)
     all_outfits = recommender.recommend_outfits(occasion, limit=limit * 2)  # generate more to filter later
 
     filtered = []
     for outfit in all_outfits:
-        item_cats = [item.get("category", "").lower() for item in outfit["items"]]
-        if all(any(need in cat for cat in item_cats) for need in needed_categories):
+        # Distinct categories of the outfit, lower-cased once
+        cats = {item.get('category', '').lower() for item in outfit["items"]}
+        if all(any(need in cat for cat in cats) for need in needed_categories):
             filtered.append(outfit)
         if len(filtered) >= limit:
             break
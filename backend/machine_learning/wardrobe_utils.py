@@ -1,31 +1,130 @@
-import os, json, re
+import os, json, re, hashlib
 import numpy as np
 import cv2
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from collections import Counter
-import webcolors
+from concurrent.futures import ThreadPoolExecutor
+import tensorflow as tf
 from tensorflow.keras.applications.resnet50 import ResNet50, preprocess_input
-from tensorflow.keras.preprocessing import image
 from tensorflow.keras.models import Model
 
 # Import your color utility functions
-from utils.color_utils import get_color_name, get_all_css3_colors
+from utils.color_utils import get_color_names, rgb_to_hex, local_binary_pattern
 resnet_model = ResNet50(weights='imagenet', include_top=False, pooling='avg')
 
-def extract_features(img_path):
-    try:
-        img = image.load_img(img_path, target_size=(224, 224))
-        x = image.img_to_array(img)
-        x = np.expand_dims(x, axis=0)
-        x = preprocess_input(x)
-        features = resnet_model.predict(x)
-        return features[0]
-    except Exception as e:
-        print(f"Error processing {img_path}: {e}")
+KMEANS_SAMPLE_SIZE = 10000  # pixels clustered per image in extract_dominant_colors
+COLOR_MAX_SIDE = 256  # longest side images are shrunk to before color extraction
+FEATURE_BATCH_SIZE = 32  # images per ResNet call in build_wardrobe_features
+ANALYSIS_WORKERS = min(8, os.cpu_count() or 4)  # threads running color and texture analysis
+WARDROBE_FEATURES_PATH = "data/wardrobe_features.jsonl"  # one JSON item per line
+DECODE_CACHE_DIR = "data/decoded"  # suggested cache_dir for build_wardrobe_features
+# Share of the image the fast background mask must keep to be trusted
+FAST_MASK_MIN_COVERAGE = 0.05
+FAST_MASK_MAX_COVERAGE = 0.95
+
+# One traced graph for every batch size, called directly instead of via predict()
+@tf.function(input_signature=[tf.TensorSpec((None, 224, 224, 3), tf.float32)])
+def resnet_batch(x):
+    return resnet_model(x, training=False)
+
+def resnet_pixels(img):
+    """224×224 RGB uint8 ResNet input of a decoded BGR image, before preprocess_input"""
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    # INTER_NEAREST_EXACT picks the same pixels as Keras' nearest load_img resize
+    return cv2.resize(rgb, (224, 224), interpolation=cv2.INTER_NEAREST_EXACT)
+
+def color_image(img):
+    """Copy of a decoded BGR image shrunk to COLOR_MAX_SIDE for color extraction"""
+    # Dominant colors do not need full resolution; background removal and
+    # clustering cost scales with the pixel count
+    h, w = img.shape[:2]
+    scale = COLOR_MAX_SIDE / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return img
+
+def prepare_image(img_path, img):
+    """
+    What build_wardrobe_features reads from the decoded BGR image of img_path:
+    the ResNet input, the shrunk color image, the original size and the
+    texture features.
+    """
+    return {
+        "resnet": resnet_pixels(img),
+        "color": color_image(img),
+        "size": img.shape[:2],
+        "texture": extract_texture_features(img_path, img=img),
+    }
+
+def image_cache_key(img_path):
+    """Cache file name of an image, keyed by its path, mtime and size"""
+    stat = os.stat(img_path)
+    key = hashlib.blake2b(f"{os.path.abspath(img_path)}|{stat.st_mtime_ns}|{stat.st_size}".encode(),
+                          digest_size=16).hexdigest()
+    return f"{key}.npz"
+
+def load_image_data(img_path, cache_dir=None):
+    """
+    prepare_image of the image at img_path (None if unreadable).
+    With cache_dir, the result is kept there as a small .npz keyed by path,
+    mtime and size, so later runs skip decoding the full image.
+    """
+    cache_path = os.path.join(cache_dir, image_cache_key(img_path)) if cache_dir is not None else None
+    if cache_path is not None and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            return {
+                "resnet": cached["resnet"],
+                "color": cached["color"],
+                "size": tuple(int(v) for v in cached["size"]),
+                "texture": json.loads(str(cached["texture"])),
+            }
+    img = cv2.imread(img_path)
+    if img is None:
         return None
+    data = prepare_image(img_path, img)
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, resnet=data["resnet"], color=data["color"], size=np.array(data["size"]),
+                     texture=np.array(json.dumps(data["texture"])))
+        os.replace(tmp_path, cache_path)
+    return data
+
+def prune_image_cache(cache_dir, keep):
+    """Delete cache files of cache_dir whose names are not in keep"""
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npz") and name not in keep:
+            os.remove(os.path.join(cache_dir, name))
 
-def remove_background(img):
-    """Remove background using GrabCut algorithm"""
+def extract_features_from_images(images):
+    """ResNet features of resnet_pixels arrays in one model call; None where an image is None"""
+    features = [None] * len(images)
+    positions = [i for i, img in enumerate(images) if img is not None]
+    if positions:
+        x = preprocess_input(np.stack([images[i] for i in positions]).astype(np.float32))
+        batch = resnet_batch(x).numpy()
+        for i, f in zip(positions, batch):
+            features[i] = f
+    return features
+
+def remove_background(img, method='fast'):
+    """Remove background with an Otsu saturation mask ('fast') or GrabCut ('grabcut')"""
+    if method == 'fast':
+        # Catalog shots sit on plain, low-saturation backgrounds: one Otsu
+        # threshold on saturation separates the item, closing fills small holes
+        hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
+        _, mask = cv2.threshold(hsv[:, :, 1], 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        mask2 = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+        
+        # Fall back to GrabCut when saturation does not separate the item
+        # (e.g. white on white): almost nothing or almost everything kept
+        coverage = mask2.mean()
+        if FAST_MASK_MIN_COVERAGE <= coverage <= FAST_MASK_MAX_COVERAGE:
+            return img * mask2[:, :, np.newaxis], mask2
+    
     height, width = img.shape[:2]
     
     # Create mask for GrabCut
@@ -49,15 +148,16 @@ def remove_background(img):
     
     return result, mask2
 
-def extract_dominant_colors(img_path, n_colors=5, remove_bg=True):
-    """Extract dominant colors using KMeans clustering"""
+def extract_dominant_colors(img_path, n_colors=5, remove_bg=True, img=None):
+    """Extract dominant colors using KMeans clustering; img is an already decoded BGR image of img_path"""
     try:
         # Load image
-        img = cv2.imread(img_path)
+        if img is None:
+            img = cv2.imread(img_path)
         if img is None:
             return None
             
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        img = cv2.cvtColor(color_image(img), cv2.COLOR_BGR2RGB)
         
         # Remove background if requested
         if remove_bg:
@@ -73,30 +173,39 @@ def extract_dominant_colors(img_path, n_colors=5, remove_bg=True):
         if len(pixels) == 0:
             return None
             
-        # Apply KMeans clustering
-        kmeans = KMeans(n_clusters=n_colors, random_state=42, n_init=10)
-        kmeans.fit(pixels)
+        # Cluster a fixed-size random sample; 10k pixels pin down 5 colors fine
+        sample = pixels
+        if len(pixels) > KMEANS_SAMPLE_SIZE:
+            sample = pixels[np.random.default_rng(42).choice(len(pixels), KMEANS_SAMPLE_SIZE, replace=False)]
+        kmeans = MiniBatchKMeans(n_clusters=n_colors, random_state=42, n_init=3, batch_size=1024, max_iter=50)
+        kmeans.fit(sample)
         
         # Get colors and their frequencies
         colors = kmeans.cluster_centers_.astype(int)
-        labels = kmeans.labels_
+        # Assign every foreground pixel, so percentages cover the whole item
+        labels = kmeans.predict(pixels)
         
         # Calculate color percentages
-        label_counts = Counter(labels)
+        label_counts = np.bincount(labels, minlength=n_colors)
         total_pixels = len(labels)
         
+        # Name all centroids in one lookup, and convert them to HSV and
+        # brightness in one call each
+        color_names = get_color_names(colors.tolist())
+        hsv_colors = cv2.cvtColor(colors.reshape(-1, 1, 3).astype(np.uint8), cv2.COLOR_RGB2HSV).reshape(-1, 3)
+        brightness = colors.mean(axis=1).astype(int)
+        
         color_info = []
         for i, color in enumerate(colors):
-            percentage = (label_counts[i] / total_pixels) * 100
+            percentage = (int(label_counts[i]) / total_pixels) * 100
             
             # Convert to hex
-            hex_color = "#{:02x}{:02x}{:02x}".format(color[0], color[1], color[2])
+            hex_color = rgb_to_hex(*color)
             
-            # Use the fixed color name function from utils
-            color_name = get_color_name(color.tolist())
+            color_name = color_names[i]
             
             # Calculate color properties
-            hsv_color = cv2.cvtColor(np.uint8([[color]]), cv2.COLOR_RGB2HSV)[0][0]
+            hsv_color = hsv_colors[i]
             
             color_info.append({
                 "rgb": color.tolist(),
@@ -104,7 +213,7 @@ def extract_dominant_colors(img_path, n_colors=5, remove_bg=True):
                 "name": color_name,
                 "percentage": round(percentage, 2),
                 "hsv": hsv_color.tolist(),
-                "brightness": int(np.mean(color)),
+                "brightness": int(brightness[i]),
                 "saturation": int(hsv_color[1]),
                 "hue": int(hsv_color[0])
             })
@@ -118,101 +227,19 @@ def extract_dominant_colors(img_path, n_colors=5, remove_bg=True):
         print(f"Error extracting colors from {img_path}: {e}")
         return None
 
-def get_color_name_fallback(rgb_color):
-    """
-    Alternative implementation using the static color dictionary
-    This is a backup in case the utils import fails
-    """
-    def get_css3_colors():
-        return {
-            'aliceblue': '#f0f8ff', 'antiquewhite': '#faebd7', 'aqua': '#00ffff',
-            'aquamarine': '#7fffd4', 'azure': '#f0ffff', 'beige': '#f5f5dc',
-            'bisque': '#ffe4c4', 'black': '#000000', 'blanchedalmond': '#ffebcd',
-            'blue': '#0000ff', 'blueviolet': '#8a2be2', 'brown': '#a52a2a',
-            'burlywood': '#deb887', 'cadetblue': '#5f9ea0', 'chartreuse': '#7fff00',
-            'chocolate': '#d2691e', 'coral': '#ff7f50', 'cornflowerblue': '#6495ed',
-            'cornsilk': '#fff8dc', 'crimson': '#dc143c', 'cyan': '#00ffff',
-            'darkblue': '#00008b', 'darkcyan': '#008b8b', 'darkgoldenrod': '#b8860b',
-            'darkgray': '#a9a9a9', 'darkgreen': '#006400', 'darkgrey': '#a9a9a9',
-            'darkkhaki': '#bdb76b', 'darkmagenta': '#8b008b', 'darkolivegreen': '#556b2f',
-            'darkorange': '#ff8c00', 'darkorchid': '#9932cc', 'darkred': '#8b0000',
-            'darksalmon': '#e9967a', 'darkseagreen': '#8fbc8f', 'darkslateblue': '#483d8b',
-            'darkslategray': '#2f4f4f', 'darkslategrey': '#2f4f4f', 'darkturquoise': '#00ced1',
-            'darkviolet': '#9400d3', 'deeppink': '#ff1493', 'deepskyblue': '#00bfff',
-            'dimgray': '#696969', 'dimgrey': '#696969', 'dodgerblue': '#1e90ff',
-            'firebrick': '#b22222', 'floralwhite': '#fffaf0', 'forestgreen': '#228b22',
-            'fuchsia': '#ff00ff', 'gainsboro': '#dcdcdc', 'ghostwhite': '#f8f8ff',
-            'gold': '#ffd700', 'goldenrod': '#daa520', 'gray': '#808080',
-            'green': '#008000', 'greenyellow': '#adff2f', 'grey': '#808080',
-            'honeydew': '#f0fff0', 'hotpink': '#ff69b4', 'indianred': '#cd5c5c',
-            'indigo': '#4b0082', 'ivory': '#fffff0', 'khaki': '#f0e68c',
-            'lavender': '#e6e6fa', 'lavenderblush': '#fff0f5', 'lawngreen': '#7cfc00',
-            'lemonchiffon': '#fffacd', 'lightblue': '#add8e6', 'lightcoral': '#f08080',
-            'lightcyan': '#e0ffff', 'lightgoldenrodyellow': '#fafad2', 'lightgray': '#d3d3d3',
-            'lightgreen': '#90ee90', 'lightgrey': '#d3d3d3', 'lightpink': '#ffb6c1',
-            'lightsalmon': '#ffa07a', 'lightseagreen': '#20b2aa', 'lightskyblue': '#87cefa',
-            'lightslategray': '#778899', 'lightslategrey': '#778899', 'lightsteelblue': '#b0c4de',
-            'lightyellow': '#ffffe0', 'lime': '#00ff00', 'limegreen': '#32cd32',
-            'linen': '#faf0e6', 'magenta': '#ff00ff', 'maroon': '#800000',
-            'mediumaquamarine': '#66cdaa', 'mediumblue': '#0000cd', 'mediumorchid': '#ba55d3',
-            'mediumpurple': '#9370db', 'mediumseagreen': '#3cb371', 'mediumslateblue': '#7b68ee',
-            'mediumspringgreen': '#00fa9a', 'mediumturquoise': '#48d1cc', 'mediumvioletred': '#c71585',
-            'midnightblue': '#191970', 'mintcream': '#f5fffa', 'mistyrose': '#ffe4e1',
-            'moccasin': '#ffe4b5', 'navajowhite': '#ffdead', 'navy': '#000080',
-            'oldlace': '#fdf5e6', 'olive': '#808000', 'olivedrab': '#6b8e23',
-            'orange': '#ffa500', 'orangered': '#ff4500', 'orchid': '#da70d6',
-            'palegoldenrod': '#eee8aa', 'palegreen': '#98fb98', 'paleturquoise': '#afeeee',
-            'palevioletred': '#db7093', 'papayawhip': '#ffefd5', 'peachpuff': '#ffdab9',
-            'peru': '#cd853f', 'pink': '#ffc0cb', 'plum': '#dda0dd',
-            'powderblue': '#b0e0e6', 'purple': '#800080', 'red': '#ff0000',
-            'rosybrown': '#bc8f8f', 'royalblue': '#4169e1', 'saddlebrown': '#8b4513',
-            'salmon': '#fa8072', 'sandybrown': '#f4a460', 'seagreen': '#2e8b57',
-            'seashell': '#fff5ee', 'sienna': '#a0522d', 'silver': '#c0c0c0',
-            'skyblue': '#87ceeb', 'slateblue': '#6a5acd', 'slategray': '#708090',
-            'slategrey': '#708090', 'snow': '#fffafa', 'springgreen': '#00ff7f',
-            'steelblue': '#4682b4', 'tan': '#d2b48c', 'teal': '#008080',
-            'thistle': '#d8bfd8', 'tomato': '#ff6347', 'turquoise': '#40e0d0',
-            'violet': '#ee82ee', 'wheat': '#f5deb3', 'white': '#ffffff',
-            'whitesmoke': '#f5f5f5', 'yellow': '#ffff00', 'yellowgreen': '#9acd32'
-        }
-    
-    try:
-        # Try to get exact name
-        return webcolors.rgb_to_name(rgb_color, spec='css3')
-    except ValueError:
-        # Find closest color name using static dictionary
-        min_distance = float("inf")
-        closest_name = None
-        
-        for name, hex_code in get_css3_colors().items():
-            r_c, g_c, b_c = webcolors.hex_to_rgb(hex_code)
-            rd = (r_c - rgb_color[0]) ** 2
-            gd = (g_c - rgb_color[1]) ** 2
-            bd = (b_c - rgb_color[2]) ** 2
-            distance = rd + gd + bd
-            
-            if distance < min_distance:
-                min_distance = distance
-                closest_name = name
-        
-        return closest_name
-
 def analyze_color_harmony(colors):
     """Analyze color relationships and harmony"""
     if len(colors) < 2:
         return {"harmony_type": "monochromatic", "compatibility_score": 1.0}
     
-    hues = [color['hue'] for color in colors[:3]]  # Use top 3 colors
+    hues = np.array([color['hue'] for color in colors[:3]])  # Use top 3 colors
     
-    # Calculate hue differences
-    hue_diffs = []
-    for i in range(len(hues)):
-        for j in range(i+1, len(hues)):
-            diff = abs(hues[i] - hues[j])
-            diff = min(diff, 180 - diff)  # Account for circular nature of hue
-            hue_diffs.append(diff)
+    # Calculate hue differences of every pair at once
+    diffs = np.abs(hues[:, None] - hues[None, :])
+    diffs = np.minimum(diffs, 180 - diffs)  # OpenCV hue is circular over 0-179
+    hue_diffs = diffs[np.triu_indices(len(hues), 1)]
     
-    avg_hue_diff = np.mean(hue_diffs)
+    avg_hue_diff = float(np.mean(hue_diffs))
     
     # Determine harmony type
     if avg_hue_diff < 30:
@@ -233,46 +260,29 @@ def analyze_color_harmony(colors):
         "average_hue_difference": round(avg_hue_diff, 2)
     }
 
-def extract_texture_features(img_path):
-    """Extract texture features using Local Binary Patterns"""
+def extract_texture_features(img_path, img=None):
+    """Extract texture features using Local Binary Patterns; img is an already decoded BGR image of img_path"""
     try:
-        img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+        if img is not None:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        else:
+            img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
         if img is None:
             return None
             
         # Calculate Local Binary Pattern
-        def lbp(img, radius=1, n_points=8):
-            h, w = img.shape
-            lbp_img = np.zeros((h, w), dtype=np.uint8)
-            
-            for i in range(radius, h - radius):
-                for j in range(radius, w - radius):
-                    center = img[i, j]
-                    binary_string = ""
-                    
-                    for p in range(n_points):
-                        angle = 2 * np.pi * p / n_points
-                        x = int(i + radius * np.cos(angle))
-                        y = int(j + radius * np.sin(angle))
-                        
-                        if img[x, y] >= center:
-                            binary_string += "1"
-                        else:
-                            binary_string += "0"
-                    
-                    lbp_img[i, j] = int(binary_string, 2)
-            
-            return lbp_img
-        
-        lbp_img = lbp(img)
+        lbp_img = local_binary_pattern(img)
+        hist = np.histogram(lbp_img, bins=256)[0]
+        # One variance pass over the image serves both contrast (its std) and homogeneity
+        img_var = np.var(img)
         
         # Calculate texture statistics
         texture_stats = {
             "mean": float(np.mean(lbp_img)),
             "std": float(np.std(lbp_img)),
-            "entropy": float(-np.sum(np.histogram(lbp_img, bins=256)[0] * np.log2(np.histogram(lbp_img, bins=256)[0] + 1e-10))),
-            "contrast": float(np.std(img)),
-            "homogeneity": float(1 / (1 + np.var(img)))
+            "entropy": float(-np.sum(hist * np.log2(hist + 1e-10))),
+            "contrast": float(np.sqrt(img_var)),
+            "homogeneity": float(1 / (1 + img_var))
         }
         
         return texture_stats
@@ -305,111 +315,135 @@ def infer_category_from_folder(folder_name):
     match = re.search(r'([A-Za-z]+)$', folder_name)
     return match.group(1).lower() if match else "unknown"
 
-def build_wardrobe_features(image_folder="img/"):
-    all_items = []
+def build_wardrobe_features(image_folder="img/", cache_dir=None):
+    """
+    Analyze every image under image_folder, streaming one item per line to
+    WARDROBE_FEATURES_PATH; returns the number of items written.
+    With a cache_dir (e.g. DECODE_CACHE_DIR) the per-image ResNet input, color
+    image, size and texture features are kept there for later runs; entries
+    for images no longer present or changed since are removed at the end.
+    """
+    item_count = 0
+    cache_keys = set()
+    # Per-category item count and top-2 color names, tallied as items are written
+    color_summary = {}
     
     # Create data directory if it doesn't exist
     os.makedirs("data", exist_ok=True)
     
-    for subfolder in os.listdir(image_folder):
-        subfolder_path = os.path.join(image_folder, subfolder)
-        if not os.path.isdir(subfolder_path): 
-            continue
+    # cv2 and the k-means inner loops release the GIL, so threads overlap the
+    # per-image decoding and analysis with each other and with ResNet in the
+    # main thread.
+    # Items are written as they are built, so memory stays at one batch.
+    with open(WARDROBE_FEATURES_PATH, "w") as out, \
+            ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="wardrobe-analysis") as executor:
+        for subfolder in os.listdir(image_folder):
+            subfolder_path = os.path.join(image_folder, subfolder)
+            if not os.path.isdir(subfolder_path): 
+                continue
 
-        inferred_category = infer_category_from_folder(subfolder)
-        print(f"Processing category: {inferred_category}")
+            inferred_category = infer_category_from_folder(subfolder)
+            print(f"Processing category: {inferred_category}")
 
-        for filename in os.listdir(subfolder_path):
-            if not filename.lower().endswith((".jpg", ".png", ".jpeg")):
-                continue
-                
-            image_path = os.path.join(subfolder_path, filename)
-            print(f"Processing: {filename}")
-            
-            # Extract ResNet features
-            features = extract_features(image_path)
-            if features is None: 
-                continue
-            
-            # Extract color information
-            colors = extract_dominant_colors(image_path, n_colors=5)
-            if colors is None:
-                continue
-            
-            # Extract texture features
-            texture = extract_texture_features(image_path)
-            
-            # Analyze color harmony
-            color_harmony = analyze_color_harmony(colors)
-            
-            # Get season compatibility
-            season = get_season_compatibility(colors)
-            
-            # Get image metadata
-            img = cv2.imread(image_path)
-            height, width = img.shape[:2] if img is not None else (0, 0)
+            filenames = [f for f in os.listdir(subfolder_path) if f.lower().endswith((".jpg", ".png", ".jpeg"))]
+        
+            for start in range(0, len(filenames), FEATURE_BATCH_SIZE):
+                batch_names = filenames[start:start + FEATURE_BATCH_SIZE]
+                batch_paths = [os.path.join(subfolder_path, f) for f in batch_names]
+                if cache_dir is not None:
+                    cache_keys.update(image_cache_key(p) for p in batch_paths)
+                # Decode each image once (or read it from the cache), start the color
+                # analysis, then extract ResNet features for the batch in one call
+                batch_data = list(executor.map(load_image_data, batch_paths, [cache_dir] * len(batch_paths)))
+                analyses = [executor.submit(extract_dominant_colors, p, 5, True, data["color"]) if data is not None else None
+                            for p, data in zip(batch_paths, batch_data)]
+                batch_features = extract_features_from_images(
+                    [data["resnet"] if data is not None else None for data in batch_data]
+                )
             
-            item_data = {
-                "product": subfolder,
-                "filename": filename,
-                "filepath": image_path,
-                "category": inferred_category,
-                "embedding": features.tolist(),
-                "colors": colors,
-                "color_harmony": color_harmony,
-                "texture_features": texture,
-                "season_compatibility": season,
-                "metadata": {
-                    "image_width": width,
-                    "image_height": height,
-                    "dominant_color": colors[0]['hex'] if colors else None,
-                    "color_palette": [color['hex'] for color in colors[:3]],
-                    "primary_color_name": colors[0]['name'] if colors else None,
-                    "color_diversity": len(set(color['name'] for color in colors)),
-                    "brightness_level": "bright" if colors and colors[0]['brightness'] > 150 else "dark",
-                    "saturation_level": "saturated" if colors and colors[0]['saturation'] > 100 else "muted"
-                }
-            }
+                for filename, image_path, data, analysis, features in zip(batch_names, batch_paths, batch_data,
+                                                                            analyses, batch_features):
+                    print(f"Processing: {filename}")
+                
+                    if features is None: 
+                        print(f"Error processing {image_path}: could not decode image")
+                        continue
+                
+                    # Color information and texture features
+                    colors = analysis.result()
+                    if colors is None:
+                        continue
+                    texture = data["texture"]
+                
+                    # Analyze color harmony
+                    color_harmony = analyze_color_harmony(colors)
+                
+                    # Get season compatibility
+                    season = get_season_compatibility(colors)
+                
+                    # Get image metadata
+                    height, width = data["size"]
+                
+                    item_data = {
+                        "product": subfolder,
+                        "filename": filename,
+                        "filepath": image_path,
+                        "category": inferred_category,
+                        "embedding": features.tolist(),
+                        "colors": colors,
+                        "color_harmony": color_harmony,
+                        "texture_features": texture,
+                        "season_compatibility": season,
+                        "metadata": {
+                            "image_width": width,
+                            "image_height": height,
+                            "dominant_color": colors[0]['hex'] if colors else None,
+                            "color_palette": [color['hex'] for color in colors[:3]],
+                            "primary_color_name": colors[0]['name'] if colors else None,
+                            "color_diversity": len(set(color['name'] for color in colors)),
+                            "brightness_level": "bright" if colors and colors[0]['brightness'] > 150 else "dark",
+                            "saturation_level": "saturated" if colors and colors[0]['saturation'] > 100 else "muted"
+                        }
+                    }
             
-            all_items.append(item_data)
-
-    # Save detailed wardrobe data
-    with open("data/wardrobe_features.json", "w") as f:
-        json.dump(all_items, f, indent=2)
+                    # Save detailed wardrobe data
+                    out.write(json.dumps(item_data) + "\n")
+                    item_count += 1
+                
+                    summary = color_summary.setdefault(inferred_category, {'colors': Counter(), 'count': 0})
+                    summary['count'] += 1
+                    summary['colors'].update(c['name'] for c in colors[:2])
     
-    # Save color summary
-    color_summary = {}
-    for item in all_items:
-        category = item['category']
-        if category not in color_summary:
-            color_summary[category] = {'colors': [], 'count': 0}
-        
-        color_summary[category]['count'] += 1
-        if item['colors']:
-            color_summary[category]['colors'].extend([c['name'] for c in item['colors'][:2]])
+    if cache_dir is not None:
+        prune_image_cache(cache_dir, cache_keys)
     
     # Get most common colors per category
     for category in color_summary:
-        color_counts = Counter(color_summary[category]['colors'])
-        color_summary[category]['most_common_colors'] = color_counts.most_common(5)
+        color_summary[category]['most_common_colors'] = color_summary[category]['colors'].most_common(5)
         del color_summary[category]['colors']
     
     with open("data/color_summary.json", "w") as f:
         json.dump(color_summary, f, indent=2)
     
-    print(f"Processed {len(all_items)} items")
-    print(f"Data saved to data/wardrobe_features.json and data/color_summary.json")
+    print(f"Processed {item_count} items")
+    print(f"Data saved to {WARDROBE_FEATURES_PATH} and data/color_summary.json")
     
-    return all_items
+    return item_count
+
+def load_wardrobe_features(path=WARDROBE_FEATURES_PATH):
+    """Yield the items written by build_wardrobe_features one at a time"""
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
 
 # Usage example
 if __name__ == "__main__":
     # Build wardrobe features with color analysis
-    wardrobe_items = build_wardrobe_features()
+    item_count = build_wardrobe_features()
     
     # Print sample color information
-    if wardrobe_items:
-        sample_item = wardrobe_items[0]
+    if item_count:
+        sample_item = next(load_wardrobe_features())
         print("\nSample color analysis:")
         print(f"Item: {sample_item['filename']}")
         print(f"Category: {sample_item['category']}")
@@ -1,13 +1,37 @@
-from fastapi import FastAPI, Request
+from fastapi import APIRouter, FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
+from collections import OrderedDict
 from contextlib import asynccontextmanager
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
+import aiomysql
+import orjson
 import uvicorn
 
+try:
+    import fcntl
+except ImportError:  # Windows: development runs a single process
+    fcntl = None
+
 from app.db import database
-from app.db.database import Base, get_database_connection, init_clothes_database, SessionLocal
+from app.db.database import (
+    create_mysql_database_if_not_exists,
+    init_clothes_database,
+    create_tables,
+    SessionLocal
+)
 from app.db.init_db import init_db
 
 from app.routes import (
@@ -24,55 +48,191 @@ from app.routes import (
     weekly_plan_routes
 )
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: handlers on the event loop only enqueue records, and a
+# listener thread writes them to stderr. Replaces the basicConfig handler the
+# routers installed on import. The listener lives as long as the process (not
+# one lifespan), and drains what is left in the queue at exit.
+log_queue = queue.SimpleQueue()
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+root_logger = logging.getLogger()
+root_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+root_logger.setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-MYSQL_CONFIG = {
-    'host': 'localhost',
-    'database': 'image_processing',
-    'user': 'enoch',
-    'password': 'enoch',
-    'port': 3306
-}
-
-
 UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs("static", exist_ok=True)
+STATIC_DIR = "static"
 
 
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB per file
 MAX_FILES_PER_REQUEST = 20
 MIN_FILES_PER_REQUEST = 1
 
+# Long-lived MySQL pool shared by the health probe (connections reused, recycled after 30 min)
+MYSQL_POOL_MIN_SIZE = 5
+MYSQL_POOL_MAX_SIZE = 20
+MYSQL_POOL_RECYCLE = 1800
+
+# Seconds one database check answers /health/ probes for
+HEALTH_DB_CACHE_TTL = 5
+# Seconds a database check may take before the database counts as unhealthy
+HEALTH_DB_TIMEOUT = 1.0
+
+# Resolved paths of served files remembered by CachedStaticFiles
+STATIC_LOOKUP_CACHE_SIZE = 4096
+
+# Threads per worker for model inference and image processing, kept off the event loop
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+# Held while a worker runs the one-time schema setup
+STARTUP_LOCK_FILE = ".startup.lock"
+
+
+@asynccontextmanager
+async def startup_lock():
+    """One worker at a time runs the database setup, so workers don't race to CREATE TABLE"""
+    if fcntl is None:
+        yield
+        return
+    with open(STARTUP_LOCK_FILE, "w") as lock_file:
+        await run_in_threadpool(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 
-Base.metadata.create_all(bind=database.engine)
+def init_app_data():
+    db = SessionLocal()
+    try:
+        init_db(db)
+    finally:
+        db.close()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Created here rather than at import, so reloads and worker imports don't repeat it
+    Path(UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    Path(STATIC_DIR).mkdir(parents=True, exist_ok=True)
+
     logger.info("Starting up: Initializing clothes database and tables.")
-    init_clothes_database()
+    # Blocking setup runs in the threadpool, after import and before serving,
+    # in a fixed order: databases, tables, then seed data
+    async with startup_lock():
+        await run_in_threadpool(create_mysql_database_if_not_exists)
+        await run_in_threadpool(init_clothes_database)
+        await create_tables()
+        await run_in_threadpool(init_app_data)
 
-    db = SessionLocal()
-    init_db(db)
-    db.close()
+    app.state.mysql_pool = await aiomysql.create_pool(
+        minsize=MYSQL_POOL_MIN_SIZE,
+        maxsize=MYSQL_POOL_MAX_SIZE,
+        pool_recycle=MYSQL_POOL_RECYCLE,
+        host=database.MYSQL_CONFIG['host'],
+        port=database.MYSQL_CONFIG['port'],
+        user=database.MYSQL_CONFIG['user'],
+        password=database.MYSQL_CONFIG['password'],
+        db=database.MYSQL_CONFIG['database'],
+        autocommit=True
+    )
+
+    # Shared by the routers for ResNet inference; threads reuse the models
+    # loaded at import, and TensorFlow releases the GIL while it runs
+    app.state.cpu_pool = ThreadPoolExecutor(max_workers=CPU_POOL_WORKERS, thread_name_prefix="cpu")
+
+    # Checked once: the upload directory is created above and not removed while serving
+    upload_dir_exists = os.path.exists(UPLOAD_DIR)
+    app.state.upload_directory = {
+        "exists": upload_dir_exists,
+        "writable": os.access(UPLOAD_DIR, os.W_OK) if upload_dir_exists else False
+    }
     logger.info("Startup complete.")
     
     yield
 
-    logger.info("Shutting down: Cleanup if needed.")
+    logger.info("Shutting down: Closing MySQL pool and CPU pool.")
+    app.state.mysql_pool.close()
+    await app.state.mysql_pool.wait_closed()
+    app.state.cpu_pool.shutdown()
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON responses encoded by orjson (C) instead of the stdlib json module"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles that remembers the resolved path of each file it has served
+    (LRU, up to STATIC_LOOKUP_CACHE_SIZE), skipping the realpath walk on
+    repeat requests. Files are still stat'ed every time, so deleted or
+    replaced uploads are seen; misses are never cached.
+    """
+
+    def __init__(self, *args, cache_size: int = STATIC_LOOKUP_CACHE_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_size = cache_size
+        self._lookup_cache = OrderedDict()
+        self._lookup_lock = threading.Lock()  # lookup_path runs in the threadpool
+
+    def lookup_path(self, path: str):
+        with self._lookup_lock:
+            full_path = self._lookup_cache.get(path)
+            if full_path is not None:
+                self._lookup_cache.move_to_end(path)
+        if full_path is not None:
+            try:
+                return full_path, os.stat(full_path)
+            except (FileNotFoundError, NotADirectoryError):
+                with self._lookup_lock:
+                    self._lookup_cache.pop(path, None)
+
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is not None:
+            with self._lookup_lock:
+                self._lookup_cache[path] = full_path
+                if len(self._lookup_cache) > self._cache_size:
+                    self._lookup_cache.popitem(last=False)
+        return full_path, stat_result
+
+
+class HealthProbeMiddleware:
+    """
+    Answers GET/HEAD /health/ directly with the health_check payload; every
+    other request goes on to the app.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/health/" and scope["method"] in ("GET", "HEAD"):
+            response = ORJSONResponse(await health_check())
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
 
 
 app = FastAPI(
     title="Image Processing API",
     description="AI-powered image processing with ResNet50 features and MySQL storage - Multiple upload support",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# Compress JSON bodies over 1 KiB; added first so CORSMiddleware wraps it
+# and its headers go on the compressed response
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -82,68 +242,125 @@ app.add_middleware(
         "http://localhost:8080"
     ],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Exactly what the frontend sends, so preflight headers are built once
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type", "X-Requested-With"],
+    max_age=86400,  # browsers reuse a preflight for a day
 )
 
-# Serve uploaded files
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Outermost, so /health/ probes skip CORS, compression and route matching
+app.add_middleware(HealthProbeMiddleware)
+
+# Serve uploaded files. Set SERVE_STATIC=0 when nginx serves both directories
+# with sendfile in front of the app (see nginx.conf and the README)
+# (check_dir=False: the directories only exist once the lifespan has run)
+if os.getenv("SERVE_STATIC", "1") != "0":
+    app.mount("/uploads", CachedStaticFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
+    app.mount("/static", CachedStaticFiles(directory=STATIC_DIR, check_dir=False), name="static")
+
 
+# Routers, all under one /api router
+api = APIRouter(prefix="/api")
+for router in (
+    auth.router,
+    user_profile.router,
+    outfit_routes.router,
+    wardrobe.router,
+    search_router.router,
+    other_routes.router,
+    admin.router,
+    classifier.router,
+    recommendation_routes.router,
+    upload_routes.router,
+    weekly_plan_routes.router
+):
+    api.include_router(router)
+app.include_router(api)
 
-# Routers
-app.include_router(auth.router, prefix="/api")
-app.include_router(user_profile.router, prefix="/api")
-app.include_router(outfit_routes.router, prefix="/api")
-app.include_router(wardrobe.router, prefix="/api")
-app.include_router(search_router.router, prefix="/api")
-app.include_router(other_routes.router, prefix="/api")
-app.include_router(admin.router, prefix="/api")
-app.include_router(classifier.router, prefix="/api")
-app.include_router(recommendation_routes.router, prefix="/api")
-app.include_router(upload_routes.router, prefix="/api")
-app.include_router(weekly_plan_routes.router, prefix="/api")
+
+# The root payload never changes: serialized once, sent as-is
+ROOT_JSON = orjson.dumps({
+    "message": "Image Processing API is running",
+    "version": "2.0.0",
+    "status": "healthy",
+    "max_files_per_request": MAX_FILES_PER_REQUEST,
+    "max_file_size_mb": MAX_FILE_SIZE / (1024 * 1024)
+})
 
 
 @app.get("/")
 async def root():
-    return {
-        "message": "Image Processing API is running",
-        "version": "2.0.0",
-        "status": "healthy",
-        "max_files_per_request": MAX_FILES_PER_REQUEST,
-        "max_file_size_mb": MAX_FILE_SIZE / (1024 * 1024)
-    }
+    return Response(content=ROOT_JSON, media_type="application/json")
+
+
+_db_health = {"status": None, "checked_at": 0.0}
+_db_health_lock = asyncio.Lock()
+
+
+async def ping_database() -> None:
+    # Reuses a warm pooled connection instead of connecting per probe
+    async with app.state.mysql_pool.acquire() as connection:
+        async with connection.cursor() as cursor:
+            await cursor.execute("SELECT 1")
 
 
+async def get_database_status() -> str:
+    """
+    "healthy" or "unhealthy" from a SELECT 1 on the pool, rechecked at most
+    every HEALTH_DB_CACHE_TTL seconds; a burst of probes shares one check.
+    """
+    async with _db_health_lock:
+        if _db_health["status"] is None or time.monotonic() - _db_health["checked_at"] >= HEALTH_DB_CACHE_TTL:
+            try:
+                await asyncio.wait_for(ping_database(), timeout=HEALTH_DB_TIMEOUT)
+                db_status = "healthy"
+            except asyncio.TimeoutError:
+                logger.error(f"Database health check timed out after {HEALTH_DB_TIMEOUT}s")
+                db_status = "unhealthy"
+            except Exception as e:
+                logger.error(f"Database health check failed: {e}")
+                db_status = "unhealthy"
+            _db_health["status"] = db_status
+            _db_health["checked_at"] = time.monotonic()
+        return _db_health["status"]
+
+
+# Served by HealthProbeMiddleware; the route keeps /health/ in the API docs
 @app.get("/health/")
 async def health_check():
-    try:
-        connection = get_database_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT 1")
-        db_status = "healthy"
-        cursor.close()
-        connection.close()
-    except Exception as e:
-        logger.error(f"Database health check failed: {e}")
-        db_status = "unhealthy"
-
-    upload_dir_exists = os.path.exists(UPLOAD_DIR)
-    upload_dir_writable = os.access(UPLOAD_DIR, os.W_OK) if upload_dir_exists else False
+    db_status = await get_database_status()
 
     return {
         "api_status": "healthy",
         "database_status": db_status,
-        "upload_directory": {
-            "exists": upload_dir_exists,
-            "writable": upload_dir_writable
-        },
+        "upload_directory": getattr(app.state, "upload_directory", None),  # None before startup
         "version": "2.0.0",
         "max_files_per_request": MAX_FILES_PER_REQUEST,
         "max_file_size_mb": MAX_FILE_SIZE / (1024 * 1024)
     }
 
-
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if os.getenv("ENV") == "dev":
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # One async worker per core by default: every worker loads its own copy
+        # of the ML models. "auto" picks uvloop and httptools when installed.
+        # Past limit_concurrency open connections a worker answers 503 instead of
+        # queueing without bound. With several workers, uvicorn's supervisor
+        # replaces each one after limit_max_requests; a single worker has no
+        # supervisor and would just exit, so it gets no request limit.
+        workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=workers,
+            loop="auto",
+            http="auto",
+            log_level="info",
+            access_log=False,
+            limit_concurrency=200,
+            limit_max_requests=10000 if workers > 1 else None,
+            backlog=2048,
+            timeout_keep_alive=5
+        )